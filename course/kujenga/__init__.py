@@ -0,0 +1,63 @@
+"""
+Kujenga
+=======
+
+Helper code for the Kujenga lessons. The lessons themselves stay as plain,
+self-contained scripts that students can download and run; the modules here
+collect the faster and more general versions of the models and methods used
+in them, for when we want to run many simulations or fit many lines.
+
+Modules
+-------
+
+sweep
+    Batched integration of the lesson 2 epidemic models over many parameter
+    sets at once.
+models
+    The lesson 2 differential equations and their Jacobians, with their
+    parameters as arguments.
+interventions
+    Switching parameters at the exact time a threshold is crossed.
+sir
+    Peak time, peak height and final size of an SIR epidemic without
+    simulating it.
+cache
+    Memory and disk caching of simulated trajectories.
+compartments
+    Generating the right hand side and Jacobian of a model from its
+    compartments and transitions.
+ensemble
+    Forecast bands from many simulations with random parameters.
+stochastic
+    The SIR model for whole numbers of people, where chance matters.
+phaseplane
+    Vector fields, streamlines, nullclines and equilibria on the phase
+    plane.
+lotkavolterra
+    Long simulations of the rabbits and foxes that stay on their cycle, and
+    the period and size of the cycle for many parameter sets.
+streaming
+    Very long or very dense simulations in blocks of fixed size, saved to
+    disk and reduced for plotting.
+plotting
+    Plotting very long time series by first reducing them to a few thousand
+    points.
+metapopulation
+    SIR in many districts coupled through a sparse contact matrix.
+fitting
+    Fitting epidemic models to case counts using sensitivity equations.
+jit
+    The lesson models compiled with numba, when it is installed.
+regression
+    Least squares lines from a few sums, for any number of rows.
+multiple
+    Least squares with several predictors, and choosing which to use.
+robust
+    Theil-Sen and Huber lines, which outlying points cannot tilt.
+descent
+    Fitting a line by gradient descent, checked against the exact answer.
+data
+    Loading the lesson data, with a fast cached copy.
+benchmarks
+    Timings and solver statistics, run with ``python -m kujenga.benchmarks``.
+"""
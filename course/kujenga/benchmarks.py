@@ -0,0 +1,144 @@
+"""
+Benchmarks
+==========
+
+Timings and solver statistics for the kujenga modules. Run them all with::
+
+    python -m kujenga.benchmarks
+"""
+
+import time
+
+import numpy as np
+from scipy import integrate
+
+from . import jit, lotkavolterra, models
+
+
+def _timed(f, repeats):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Parameters where each epidemic model is stiff: rates far larger than the
+# time scale of the output, or in SEIR a latent period much shorter than the
+# infectious period.
+stiff_args = {
+    'SIR': (50, 100/7),
+    'SEIR': (1/5, 1/7, 1000),
+    'social epidemic': (350, 100, 100),
+}
+
+
+def jacobian_benchmark(rtol=1e-8, atol=1e-10, repeats=5):
+    """
+    Compare ``integrate.odeint`` with and without the analytic Jacobians on
+    the lesson models, counting right hand side evaluations from
+    ``full_output``.
+
+    Each model is run with the lesson parameters and, where there is one, with
+    the stiff parameter set in :data:`stiff_args`. LSODA only uses the
+    Jacobian once it has switched to its stiff method, so the lesson cases,
+    which are not stiff, show no difference.
+
+    Returns a list of ``(model, case, nfe without, nfe with, nje, seconds
+    without, seconds with)`` rows.
+    """
+    rows = []
+    for name, (dXdt, jacobian, args, X0, t) in models.lesson_examples.items():
+        cases = [('lesson', args)]
+        if name in stiff_args:
+            cases.append(('stiff', stiff_args[name]))
+        for case, case_args in cases:
+            options = dict(args=case_args, rtol=rtol, atol=atol, full_output=True)
+            without, (_, info_without) = _timed(
+                lambda: integrate.odeint(dXdt, X0, t, **options), repeats)
+            with_, (_, info_with) = _timed(
+                lambda: integrate.odeint(dXdt, X0, t, Dfun=jacobian, **options), repeats)
+            rows.append((name, case, int(info_without['nfe'][-1]), int(info_with['nfe'][-1]),
+                         int(info_with['nje'][-1]), without, with_))
+    return rows
+
+
+def print_jacobian_benchmark(**options):
+    print('Right hand side evaluations by integrate.odeint with and without Dfun\n')
+    print('%-18s %-7s %9s %9s %6s %9s %9s' % ('model', 'case', 'nfe', 'nfe Dfun',
+                                              'nje', 'ms', 'ms Dfun'))
+    for name, case, nfe, nfe_J, nje, without, with_ in jacobian_benchmark(**options):
+        print('%-18s %-7s %9d %9d %6d %9.2f %9.2f' % (name, case, nfe, nfe_J, nje,
+                                                      1000*without, 1000*with_))
+
+
+def lotka_volterra_benchmark(horizon=10000, points=10001, repeats=1):
+    """
+    Long simulations of the rabbits and foxes from the lesson: how far each
+    method drifts off the cycle, measured by the largest change in the
+    first integral :math:`V`, and how long it takes.
+
+    Returns a list of ``(method, seconds, drift)`` rows.
+    """
+    dXdt, _, args, X0, _ = models.lesson_examples['rabbits and foxes']
+    t = np.linspace(0, horizon, points)
+    V0 = lotkavolterra.first_integral(X0, *args)
+    methods = [
+        ('odeint default', lambda: integrate.odeint(dXdt, X0, t, args=args, mxstep=100000)),
+        ('odeint rtol=1e-10', lambda: integrate.odeint(dXdt, X0, t, args=args, rtol=1e-10,
+                                                       atol=1e-12, mxstep=100000)),
+        ('leapfrog h=0.01', lambda: lotkavolterra.integrate(X0, t, *args, h=0.01)),
+        ('leapfrog h=0.05', lambda: lotkavolterra.integrate(X0, t, *args, h=0.05)),
+        ('yoshida h=0.05', lambda: lotkavolterra.integrate(X0, t, *args, h=0.05, order=4)),
+    ]
+    rows = []
+    for name, run in methods:
+        seconds, X = _timed(run, repeats)
+        rows.append((name, seconds, np.max(np.abs(lotkavolterra.first_integral(X, *args) - V0))))
+    return rows
+
+
+def print_lotka_volterra_benchmark(**options):
+    print('Rabbits and foxes: drift in the first integral V over a long run\n')
+    print('%-18s %9s %12s' % ('method', 'seconds', 'drift in V'))
+    for name, seconds, drift in lotka_volterra_benchmark(**options):
+        print('%-18s %9.2f %12.2e' % (name, seconds, drift))
+
+
+def jit_benchmark(max_step=0.01, repeats=5):
+    """
+    Time ``integrate.odeint`` with the Python models against the RK4 loop in
+    :mod:`kujenga.jit` on each lesson example, and the largest difference
+    from a tight ``odeint`` solution. Without numba the loop runs as plain
+    Python, so it shows what compiling it would save.
+
+    Returns a list of ``(model, seconds odeint, seconds rk4, error odeint,
+    error rk4)`` rows.
+    """
+    rows = []
+    for name, (dXdt, _, args, X0, t) in models.lesson_examples.items():
+        reference = integrate.odeint(dXdt, X0, t, args=args, rtol=1e-12, atol=1e-12)
+        jit.rk4(name, X0, t[:2], args, max_step)         # compile outside the timing
+        seconds, X = _timed(lambda: integrate.odeint(dXdt, X0, t, args=args), repeats)
+        seconds_rk4, X_rk4 = _timed(lambda: jit.rk4(name, X0, t, args, max_step), repeats)
+        rows.append((name, seconds, seconds_rk4, np.max(np.abs(X - reference)),
+                     np.max(np.abs(X_rk4 - reference))))
+    return rows
+
+
+def print_jit_benchmark(**options):
+    print('Lesson models: integrate.odeint against the RK4 loop in kujenga.jit (%s)\n'
+          % ('compiled by numba' if jit.available else 'numba not installed, plain Python'))
+    print('%-18s %9s %9s %10s %10s' % ('model', 'ms odeint', 'ms rk4', 'err odeint', 'err rk4'))
+    for name, seconds, seconds_rk4, error, error_rk4 in jit_benchmark(**options):
+        print('%-18s %9.2f %9.2f %10.1e %10.1e' % (name, 1000*seconds, 1000*seconds_rk4,
+                                                   error, error_rk4))
+
+
+if __name__ == '__main__':
+    print_jacobian_benchmark()
+    print()
+    print_lotka_volterra_benchmark()
+    print()
+    print_jit_benchmark()
@@ -0,0 +1,279 @@
+"""
+Trajectory cache
+================
+
+The lessons often simulate exactly the same trajectory several times: once
+to plot it over time, again for the phase plane, and again for the
+nullclines. This module remembers trajectories, so that only the first call
+does any work.
+
+A trajectory is identified by a hash of everything that determines it: the
+model's code and default arguments, the values of any global parameters it
+reads (such as ``beta`` and ``gamma`` in the lessons, directly or through
+other functions), the object a method belongs to, the extra arguments, the
+initial state, the time grid and the solver options. A model that reads
+something which cannot be hashed is simply not cached. Recent trajectories are kept in
+memory and all of them are saved as ``.npy`` files, so they are still there
+the next time a lesson is run.
+
+Example
+-------
+
+>>> from kujenga import cache
+>>> X = cache.odeint(dXdt, X0, t)      # simulates and stores
+>>> X = cache.odeint(dXdt, X0, t)      # read back from memory
+"""
+
+import functools
+import hashlib
+import numbers
+import os
+import tempfile
+import types
+from collections import OrderedDict
+
+import numpy as np
+from scipy import integrate
+
+
+class _Unhashable(Exception):
+    """Raised for state that cannot be reliably included in a key."""
+
+
+# Values whose repr identifies them completely
+_plain = (numbers.Number, str, bytes, type(None), np.generic)
+
+
+def _hash_value(h, value, seen=None):
+    seen = set() if seen is None else seen
+    if isinstance(value, _plain):
+        h.update(('%s:%r' % (type(value).__name__, value)).encode())
+    elif isinstance(value, np.ndarray) or (isinstance(value, (list, tuple)) and value and
+                                           all(isinstance(v, numbers.Number) for v in value)):
+        value = np.asarray(value)
+        if value.dtype.hasobject:
+            raise _Unhashable('object array')
+        value = np.ascontiguousarray(value)
+        h.update(('array%s%s' % (value.dtype.str, value.shape)).encode())
+        h.update(value.tobytes())
+    elif id(value) in seen:
+        h.update(b'cycle')
+    elif isinstance(value, (list, tuple, dict)):
+        seen.add(id(value))
+        items = (sorted(value.items(), key=lambda item: repr(item[0]))
+                 if isinstance(value, dict) else enumerate(value))
+        h.update(('%s%d' % (type(value).__name__, len(value))).encode())
+        for k, v in items:
+            _hash_value(h, k, seen)
+            _hash_value(h, v, seen)
+    elif isinstance(value, (types.ModuleType, type)):
+        h.update(('%s:%s' % (type(value).__name__, value.__name__)).encode())
+    elif callable(value):
+        _hash_function(h, value, seen)
+    elif hasattr(value, '__dict__'):
+        # An instance, such as the model behind a bound method: its class
+        # and everything stored on it
+        seen.add(id(value))
+        h.update(('%s.%s' % (type(value).__module__, type(value).__qualname__)).encode())
+        _hash_value(h, vars(value), seen)
+    else:
+        raise _Unhashable(repr(type(value)))
+
+
+def _global_names(code):
+    """Names read by ``code`` and by the functions and comprehensions
+    defined inside it."""
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _global_names(constant)
+    return names
+
+
+def _hash_function(h, f, seen):
+    if id(f) in seen:
+        h.update(b'cycle')
+        return
+    seen.add(id(f))
+    if isinstance(f, functools.partial):
+        _hash_function(h, f.func, seen)
+        _hash_value(h, f.args, seen)
+        _hash_value(h, f.keywords, seen)
+        return
+    if isinstance(f, types.MethodType):
+        # A bound method depends on the object it is bound to
+        _hash_function(h, f.__func__, seen)
+        _hash_value(h, f.__self__, seen)
+        return
+    if not isinstance(f, types.FunctionType):
+        if isinstance(f, (types.BuiltinFunctionType, np.ufunc)):
+            h.update(repr(f).encode())
+            return
+        if hasattr(f, '__call__') and isinstance(f.__call__, types.MethodType):
+            # A callable object
+            _hash_function(h, f.__call__, seen)
+            return
+        raise _Unhashable(repr(f))
+    # The code itself, so editing a model invalidates its trajectories
+    code = f.__code__
+    h.update(('%s.%s' % (f.__module__, f.__qualname__)).encode())
+    h.update(code.co_code)
+    _hash_value(h, tuple(c for c in code.co_consts if isinstance(c, _plain)), seen)
+    # Default arguments, such as beta in dXdt(X, t, beta=0.5)
+    _hash_value(h, f.__defaults__, seen)
+    _hash_value(h, f.__kwdefaults__, seen)
+    # Global parameters the model reads, like beta and gamma in the lessons,
+    # including through lists, dictionaries and helper functions
+    for name in sorted(_global_names(code)):
+        if name not in f.__globals__:
+            continue
+        _hash_value(h, name, seen)
+        _hash_value(h, f.__globals__[name], seen)
+    # Parameters captured from an enclosing function
+    for name, cell in zip(code.co_freevars, f.__closure__ or ()):
+        _hash_value(h, name, seen)
+        _hash_value(h, cell.cell_contents, seen)
+
+
+def key(f, *values, **options):
+    """
+    The hex digest identifying a computation with the function ``f`` (its
+    code, default arguments and the parameters it reads, directly or
+    through helper functions, and for a bound method the object it belongs
+    to), the arrays or other ``values`` and the keyword ``options``.
+
+    Returns ``None`` if any of these cannot be reliably hashed, such as an
+    object without a ``__dict__``, in which case the caches do not store
+    the result.
+    """
+    h = hashlib.sha256()
+    try:
+        _hash_function(h, f, set())
+        for value in values:
+            _hash_value(h, value)
+        _hash_value(h, options)
+    except _Unhashable:
+        return None
+    return h.hexdigest()
+
+
+def trajectory_key(dXdt, X0, t, args=(), **options):
+    """The hex digest identifying a simulation of ``dXdt``."""
+    return key(dXdt, tuple(args), np.asarray(X0, dtype=float),
+               np.asarray(t, dtype=float), **options)
+
+
+class TrajectoryCache:
+    """
+    A least recently used memory cache of trajectories backed by a directory
+    of ``.npy`` files.
+
+    Parameters
+    ----------
+    directory : str or None
+        Where to save trajectories. ``None`` keeps them in memory only.
+    maxsize : int
+        How many trajectories to keep in memory.
+    """
+
+    def __init__(self, directory=None, maxsize=128):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def _remember(self, key, X):
+        X.setflags(write=False)
+        self._memory[key] = X
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """The stored trajectory for ``key``, or ``None``."""
+        if key is None:
+            return None
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+        if self.directory is not None:
+            try:
+                X = np.load(self._path(key))
+            except (OSError, ValueError):
+                pass
+            else:
+                self.disk_hits += 1
+                self._remember(key, X)
+                return X
+        return None
+
+    def put(self, key, X):
+        """Store the trajectory ``X`` under ``key``, unless ``key`` is
+        ``None``."""
+        X = np.array(X)
+        if key is None:
+            X.setflags(write=False)
+            return X
+        self._remember(key, X)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first so that a half written file is
+            # never read back, even with several lessons running at once.
+            fd, tmp = tempfile.mkstemp(suffix='.npy', dir=self.directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, X)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                os.remove(tmp)
+                raise
+        return X
+
+    def odeint(self, dXdt, X0, t, args=(), **options):
+        """
+        A cached ``integrate.odeint(dXdt, X0, t, args, **options)``.
+
+        The returned array is read-only, since it is shared with the cache.
+        Take a copy if you need to change it.
+        """
+        if options.get('full_output'):
+            raise ValueError('full_output results are not cached')
+        key = trajectory_key(dXdt, X0, t, args, **options)
+        X = self.get(key)
+        if X is None:
+            self.misses += 1
+            X = self.put(key, integrate.odeint(dXdt, X0, t, args=tuple(args),
+                                               **options))
+        return X
+
+    def clear(self, disk=False):
+        """Forget the trajectories in memory, and on disk if ``disk``."""
+        self._memory.clear()
+        if disk and self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.npy'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def __repr__(self):
+        return 'TrajectoryCache(directory=%r, maxsize=%r, hits=%d, disk_hits=%d, misses=%d)' % (
+            self.directory, self.maxsize, self.hits, self.disk_hits, self.misses)
+
+
+def default_directory():
+    """``$KUJENGA_CACHE`` if it is set, otherwise ``~/.cache/kujenga``."""
+    return os.environ.get('KUJENGA_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'kujenga'))
+
+
+default_cache = TrajectoryCache(default_directory())
+
+
+def odeint(dXdt, X0, t, args=(), **options):
+    """``integrate.odeint`` through the shared :data:`default_cache`."""
+    return default_cache.odeint(dXdt, X0, t, args, **options)
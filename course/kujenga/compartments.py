@@ -0,0 +1,235 @@
+"""
+Compartment models
+==================
+
+The SIR, SEIR and social epidemic models, and the rabbits and foxes, are all
+built the same way: people (or animals) move between compartments at rates
+that are a parameter times a product of compartment sizes. Instead of
+writing out ``dXdt`` for each model by hand, we can describe the model by its
+compartments and transitions and generate the code.
+
+The generated right hand side unpacks the state into Python floats and
+fills a preallocated array, rather than building a new ``np.array`` from a
+list, and can write into an array passed as ``out`` instead. It comes with
+the exact Jacobian, which ``integrate.odeint`` can use through its ``Dfun``
+argument instead of estimating it by finite differences.
+
+Example
+-------
+
+>>> from scipy import integrate
+>>> from kujenga.compartments import CompartmentModel
+>>> sir = CompartmentModel('S I R', [('S', 'I', 'beta*S*I'),
+...                                  ('I', 'R', 'gamma*I')])
+>>> model = sir.compile()
+>>> X = integrate.odeint(model.rhs, X0, t, args=(1/2, 1/7), Dfun=model.jacobian)
+"""
+
+import keyword
+from collections import Counter, namedtuple
+
+import numpy as np
+
+
+Transition = namedtuple('Transition', ['source', 'target', 'rate'])
+Transition.__doc__ = """\
+A flow from compartment ``source`` to compartment ``target`` at the rate
+``rate``, a product such as ``'beta*S*I'`` of parameters, compartments and
+numbers. ``source`` is ``None`` for births and ``target`` is ``None`` for
+deaths."""
+
+
+CompiledModel = namedtuple('CompiledModel', ['rhs', 'jacobian', 'dXdt', 'source'])
+CompiledModel.__doc__ = """\
+Functions generated by :meth:`CompartmentModel.compile`.
+
+rhs(X, t, *params, out=None)
+    The derivative of a single state, a 1-D array. Returns a new array, or
+    writes into and returns ``out`` if given. Only pass ``out`` if nothing
+    keeps the previous result: ``solve_ivp`` methods such as ``'RK45'`` keep
+    the derivative of the last step and reuse it when a step is rejected.
+jacobian(X, t, *params, out=None)
+    The Jacobian ``J[i, j] = d rhs[i] / d X[j]``, likewise a new array or
+    ``out``. Pass it as ``Dfun`` to ``integrate.odeint``.
+dXdt(X, t, *params)
+    The derivative for states of any shape with the compartments along the
+    first axis, e.g. a ``meshgrid`` for drawing arrows. Returns a new array.
+source
+    The generated Python code."""
+
+
+def _check_name(name, what):
+    if not name.isidentifier() or keyword.iskeyword(name) or name.startswith('_'):
+        raise ValueError('%r is not a valid %s name' % (name, what))
+    if name in ('np', 't', 'out'):
+        raise ValueError('%r is reserved and cannot be used as a %s name' % (name, what))
+
+
+class CompartmentModel:
+    """
+    A model described by its compartments and the transitions between them.
+
+    Parameters
+    ----------
+    compartments : str or sequence of str
+        Compartment names in state order, e.g. ``'S I R'``.
+    transitions : sequence
+        :class:`Transition` or ``(source, target, rate)`` tuples. The rate is
+        a product of parameter names, compartment names and numbers, e.g.
+        ``'beta*S*I'`` or ``'0.5*d*I*R'``.
+    parameters : sequence of str, optional
+        The order of the parameter arguments of the generated functions. By
+        default, the order in which they first appear in the rates.
+    """
+
+    def __init__(self, compartments, transitions, parameters=None):
+        if isinstance(compartments, str):
+            compartments = compartments.replace(',', ' ').split()
+        self.compartments = tuple(compartments)
+        for name in self.compartments:
+            _check_name(name, 'compartment')
+        if len(set(self.compartments)) != len(self.compartments):
+            raise ValueError('compartment names must be unique')
+
+        self.transitions = []
+        self._rates = []
+        found = []
+        for transition in transitions:
+            transition = Transition(*transition)
+            for end in (transition.source, transition.target):
+                if end is not None and end not in self.compartments:
+                    raise ValueError('unknown compartment %r in %r' % (end, transition))
+            constant, factors = self._parse_rate(transition.rate)
+            found.extend(f for f in factors if f not in self.compartments and f not in found)
+            self.transitions.append(transition)
+            self._rates.append((constant, factors))
+
+        if parameters is None:
+            parameters = found
+        self.parameters = tuple(parameters)
+        for name in self.parameters:
+            _check_name(name, 'parameter')
+        missing = set(found) - set(self.parameters)
+        if missing:
+            raise ValueError('rates use parameters not in parameters: %s'
+                             % ', '.join(sorted(missing)))
+        clash = set(self.parameters) & set(self.compartments)
+        if clash:
+            raise ValueError('names used for both parameters and compartments: %s'
+                             % ', '.join(sorted(clash)))
+
+    def __repr__(self):
+        return 'CompartmentModel(%r, %r, parameters=%r)' % (
+            ' '.join(self.compartments), [tuple(tr) for tr in self.transitions],
+            self.parameters)
+
+    @staticmethod
+    def _parse_rate(rate):
+        # A rate is a product; split it into a constant and a list of names
+        constant = 1.0
+        factors = []
+        for factor in rate.replace(' ', '').split('*'):
+            if not factor:
+                raise ValueError('cannot read the rate %r' % rate)
+            try:
+                constant *= float(factor)
+            except ValueError:
+                _check_name(factor, 'rate factor')
+                factors.append(factor)
+        return constant, factors
+
+    @staticmethod
+    def _product(constant, factors):
+        terms = ([repr(constant)] if constant != 1 or not factors else []) + list(factors)
+        return '*'.join(terms)
+
+    def stoichiometry(self):
+        """The ``(compartments, transitions)`` matrix of net changes."""
+        nu = np.zeros((len(self.compartments), len(self.transitions)))
+        for k, transition in enumerate(self.transitions):
+            if transition.source is not None:
+                nu[self.compartments.index(transition.source), k] -= 1
+            if transition.target is not None:
+                nu[self.compartments.index(transition.target), k] += 1
+        return nu
+
+    def _derivative_terms(self):
+        # For each compartment, the list of (sign, transition index)
+        nu = self.stoichiometry()
+        return [[(nu[i, k], k) for k in range(len(self.transitions)) if nu[i, k]]
+                for i in range(len(self.compartments))]
+
+    @staticmethod
+    def _sum(terms):
+        code = ''
+        for coefficient, term in terms:
+            if coefficient == 1:
+                code += ' + ' + term if code else term
+            elif coefficient == -1:
+                code += ' - ' + term if code else '-' + term
+            else:
+                code += ' + %r*%s' % (coefficient, term) if code else '%r*%s' % (coefficient, term)
+        return code
+
+    def source(self):
+        """Python source code for the functions returned by :meth:`compile`."""
+        n = len(self.compartments)
+        arguments = ', '.join(('_X', 't') + self.parameters + ('out=None',))
+        unpack = '    %s%s = _X.tolist()' % (', '.join(self.compartments), ',' if n == 1 else '')
+        rates = ['    _r%d = %s' % (k, self._product(*rate))
+                 for k, rate in enumerate(self._rates)]
+        terms = self._derivative_terms()
+        derivatives = [self._sum([(c, '_r%d' % k) for c, k in terms[i]]) for i in range(n)]
+
+        lines = ['def rhs(%s):' % arguments, unpack] + rates
+        lines += ['    if out is None:', '        out = np.empty(%d)' % n]
+        lines += ['    out[%d] = %s' % (i, d if d else '0.0') for i, d in enumerate(derivatives)]
+        lines += ['    return out', '']
+
+        # d rate / d X_m for a product of factors, counting repeated factors
+        lines += ['def jacobian(%s):' % arguments, unpack]
+        lines += ['    if out is None:', '        out = np.zeros((%d, %d))' % (n, n),
+                  '    else:', '        out.fill(0.0)']
+        for i in range(n):
+            for m, name in enumerate(self.compartments):
+                entry = []
+                for c, k in terms[i]:
+                    constant, factors = self._rates[k]
+                    power = Counter(factors)[name]
+                    if power:
+                        rest = list(factors)
+                        rest.remove(name)
+                        entry.append((c, self._product(constant*power, rest)))
+                if entry:
+                    lines.append('    out[%d, %d] = %s' % (i, m, self._sum(entry)))
+        lines += ['    return out', '']
+
+        lines += ['def dXdt(%s):' % ', '.join(('_X', 't') + self.parameters)]
+        lines += ['    %s = _X[%d]' % (name, i) for i, name in enumerate(self.compartments)]
+        lines += rates
+        lines += ['    _zero = np.zeros_like(np.asarray(_X[0], dtype=float))'] \
+            if not all(derivatives) else []
+        lines += ['    return np.array([%s])' % ',\n                     '.join(
+            d if d else '_zero' for d in derivatives)]
+        return '\n'.join(lines) + '\n'
+
+    def compile(self):
+        """Generate the right hand side and Jacobian, see :class:`CompiledModel`."""
+        source = self.source()
+        namespace = {'np': np}
+        exec(compile(source, '<%r>' % self, 'exec'), namespace)
+        return CompiledModel(namespace['rhs'], namespace['jacobian'],
+                             namespace['dXdt'], source)
+
+
+sir = CompartmentModel('S I R', [('S', 'I', 'beta*S*I'),
+                                 ('I', 'R', 'gamma*I')])
+
+seir = CompartmentModel('S E I R', [('S', 'E', 'beta*S*I'),
+                                    ('E', 'I', 'delta*E'),
+                                    ('I', 'R', 'gamma*I')],
+                        parameters=('beta', 'gamma', 'delta'))
+
+social_epidemic = CompartmentModel('S I R', [('S', 'I', 'b*S*I'),
+                                             ('I', 'R', 'c*I'),
+                                             ('I', 'R', 'd*I*R')])
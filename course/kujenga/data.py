@@ -0,0 +1,122 @@
+"""
+Lesson data
+===========
+
+Lesson 1 reads ``HappinessData.csv`` with ``pd.read_csv`` and then renames
+six columns one at a time. The file also starts with a byte order mark,
+an invisible character that ends up at the front of the first column name,
+so that ``happy['Country name']`` fails.
+
+:func:`load_happiness` reads the CSV once, with the byte order mark removed
+and the columns renamed as in the lesson, and saves a copy in the Feather
+format (the Arrow format on disk) in the kujenga cache directory. Later
+loads memory map the copy and read only the columns asked for, which is
+much faster than parsing the text again. The copy is remade whenever the
+CSV changes. Reading Feather files needs pyarrow; without it the CSV is
+read every time.
+
+Example
+-------
+
+>>> from kujenga.data import load_happiness
+>>> happy = load_happiness()
+>>> df = load_happiness(['Country name', 'Year', 'Happiness', 'LifeExp'])
+>>> df = df.loc[df['Year'] == 2018]
+"""
+
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+
+from . import cache
+
+
+# The column names used in the lessons
+happiness_renames = {
+    'Social support': 'SocialSupport',
+    'Life Ladder': 'Happiness',
+    'Perceptions of corruption': 'Corruption',
+    'Log GDP per capita': 'LogGDP',
+    'Healthy life expectancy at birth': 'LifeExp',
+    'Freedom to make life choices': 'Freedom',
+}
+
+
+def data_directory():
+    """The ``lessons/data`` directory of the course."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lessons', 'data')
+
+
+def read_happiness_csv(path=None, columns=None):
+    """
+    Parse ``HappinessData.csv`` with the byte order mark removed and the
+    lesson column names, keeping only ``columns`` if given.
+    """
+    if path is None:
+        path = os.path.join(data_directory(), 'HappinessData.csv')
+    usecols = None
+    if columns is not None:
+        original = {new: old for old, new in happiness_renames.items()}
+        usecols = [original.get(column, column) for column in columns]
+    df = pd.read_csv(path, delimiter=';', encoding='utf-8-sig', usecols=usecols)
+    df = df.rename(columns=happiness_renames)
+    return df if columns is None else df[list(columns)]
+
+
+def _cache_path(path, directory):
+    # Named after the CSV's location, size and modification time, so that a
+    # changed CSV gets a new copy
+    status = os.stat(path)
+    h = hashlib.sha256(('%s\0%d\0%d' % (os.path.abspath(path), status.st_size,
+                                        status.st_mtime_ns)).encode())
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(directory, '%s-%s.feather' % (name, h.hexdigest()[:16]))
+
+
+def load_happiness(columns=None, path=None, directory=None):
+    """
+    The happiness data as a data frame, from the Feather copy if there is
+    one.
+
+    Parameters
+    ----------
+    columns : list of str, optional
+        Columns to read, with the lesson names such as ``'Happiness'`` and
+        ``'LifeExp'``. By default all of them.
+    path : str, optional
+        The CSV, by default ``lessons/data/HappinessData.csv``.
+    directory : str, optional
+        Where to keep the Feather copy, by default
+        :func:`kujenga.cache.default_directory`.
+    """
+    if path is None:
+        path = os.path.join(data_directory(), 'HappinessData.csv')
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return read_happiness_csv(path, columns)
+
+    if directory is None:
+        directory = cache.default_directory()
+    copy = _cache_path(path, directory)
+    if not os.path.exists(copy):
+        df = read_happiness_csv(path)
+        os.makedirs(directory, exist_ok=True)
+        # Uncompressed, so that it can be memory mapped; written to a
+        # temporary file first as in kujenga.cache
+        fd, tmp = tempfile.mkstemp(suffix='.feather', dir=directory)
+        os.close(fd)
+        try:
+            feather.write_feather(df, tmp, compression='uncompressed')
+            os.replace(tmp, copy)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        if columns is None:
+            return df
+        return df[list(columns)]
+    table = feather.read_table(copy, columns=None if columns is None else list(columns),
+                               memory_map=True)
+    return table.to_pandas()
@@ -0,0 +1,205 @@
+"""
+Gradient descent
+================
+
+In lesson 1 the best slope is found by setting the derivative of the sum
+of squared distances to zero and solving. Machine learning models are
+usually too complicated for that, and are instead trained by *gradient
+descent*: start from a guess and repeatedly take a small step downhill,
+against the derivative (gradient) of the objective. Here the same line is
+found that way, minimising the mean squared distance
+
+.. math::
+
+    L(m, k) = \\frac{1}{n}\\sum_i (y_i - m x_i - k)^2,
+
+so that the answer can be checked against the exact one from
+:func:`kujenga.regression.fit_line`.
+
+The gradient can be computed from all the data at every step (full batch),
+or estimated from a small random batch of rows (mini-batch, or stochastic,
+gradient descent), which takes many more but much cheaper steps.
+*Momentum* keeps moving in the direction of recent steps, and *Adam* also
+scales the step of each parameter by the size of its recent gradients.
+Before training ``x`` is centred and scaled, without which plain gradient
+descent on life expectancies of around 60 years barely moves the
+intercept.
+
+``x`` and ``y`` can be arrays memory mapped from ``.npy`` files, in which
+case only one batch of rows at a time is read from disk.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga import descent
+>>> result = descent.train(df['LifeExp'], df['Happiness'], method='adam', batch_size=32)
+>>> result.m, result.exact.m
+>>> plt.semilogy(result.trace.seconds, result.trace.loss - result.exact.sse/result.exact.n)
+
+For data on disk
+
+>>> x = np.load('x.npy', mmap_mode='r')
+>>> y = np.load('y.npy', mmap_mode='r')
+>>> result = descent.train(x, y, method='momentum', batch_size=4096, epochs=5)
+"""
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from . import regression
+
+
+Trace = namedtuple('Trace', ['m', 'k', 'loss', 'seconds'])
+Trace.__doc__ = """\
+The slope, intercept and mean squared distance at the start and after
+each epoch (pass through the data), and the seconds since training
+started."""
+
+Training = namedtuple('Training', ['m', 'k', 'loss', 'exact', 'trace', 'epochs', 'seconds'])
+Training.__doc__ = """\
+The trained line, its mean squared distance, the exact least squares line
+as a :class:`kujenga.regression.LineFit`, the :class:`Trace`, and the
+number of epochs and seconds taken."""
+
+methods = ('gd', 'momentum', 'adam')
+
+
+def _updates(method, learning_rate, beta, beta2, epsilon):
+    """The rule for one step from parameters ``p`` with gradient ``g``."""
+    if method == 'gd':
+        return lambda p, g: p - learning_rate*g
+
+    if method == 'momentum':
+        velocity = np.zeros(2)
+
+        def step(p, g):
+            velocity[:] = beta*velocity + g
+            return p - learning_rate*velocity
+        return step
+
+    first, second = np.zeros(2), np.zeros(2)
+    steps = [0]
+
+    def step(p, g):
+        steps[0] += 1
+        first[:] = beta*first + (1 - beta)*g
+        second[:] = beta2*second + (1 - beta2)*g*g
+        corrected = first/(1 - beta**steps[0])
+        scale = np.sqrt(second/(1 - beta2**steps[0])) + epsilon
+        return p - learning_rate*corrected/scale
+    return step
+
+
+def _gradient(x, y, p, centre, scale):
+    """Sum of the gradients of the squared distances of the rows ``x, y``
+    with respect to ``p = (a, b)`` for the line ``a*(x - centre)/scale + b``,
+    and the number of rows."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if not keep.all():
+        x, y = x[keep], y[keep]
+    u = (x - centre)/scale
+    r = y - p[0]*u - p[1]
+    return np.array([-2*(u @ r), -2*r.sum()]), x.size
+
+
+def train(x, y, method='gd', learning_rate=None, batch_size=None, epochs=1000, tol=1e-10,
+          seed=None, beta=0.9, beta2=0.999, epsilon=1e-8, block_size=65536):
+    """
+    Fit a line by gradient descent.
+
+    Parameters
+    ----------
+    x, y : array_like, shape ``(n,)``
+        Predictor and response, for example memory mapped arrays. Rows
+        where either is missing are left out.
+    method : {'gd', 'momentum', 'adam'}
+        Plain gradient descent, with momentum, or Adam.
+    learning_rate : float, optional
+        Size of the steps, by default 0.1 for ``'gd'`` and 0.01 for
+        ``'momentum'``, whose steps build up to ten times that, and
+        ``'adam'``. With mini-batches the line keeps wandering around the
+        best one by an amount that shrinks with the learning rate.
+    batch_size : int or None
+        Rows in each mini-batch, or ``None`` for the full batch.
+    epochs : int
+        Largest number of passes through the data.
+    tol : float
+        Stop once the exact gradient of the mean squared distance, with
+        respect to the scaled parameters, is smaller than this.
+    seed : int or None
+        Seed for the order of the mini-batches, which are runs of
+        consecutive rows taken in a random order each epoch. Rows stored in
+        some meaningful order should be shuffled once beforehand.
+    beta, beta2, epsilon : float
+        Decay of the momentum and, for Adam, of the squared gradients, and
+        Adam's guard against dividing by zero.
+    block_size : int
+        Rows read at a time for the full batch and for the first pass,
+        which finds the exact line and the scaling of ``x``.
+
+    Returns
+    -------
+    Training
+    """
+    if method not in methods:
+        raise ValueError('method must be one of %s, not %r' % (', '.join(methods), method))
+    if learning_rate is None:
+        learning_rate = 0.1 if method == 'gd' else 0.01
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x.ndim != 1 or x.shape != y.shape:
+        raise ValueError('x and y must be one dimensional and the same length, got shapes '
+                         '%s and %s' % (x.shape, y.shape))
+
+    # One pass for the exact answer, and the sums that give the loss and
+    # its gradient at any (m, k) without going through the data again
+    running = regression.RunningLine().update(x, y, block_size)
+    exact = running.line()
+    n, centre, y_mean, Sxx, Sxy, Syy = (float(value) for value in running.moments())
+    scale = np.sqrt(Sxx/n) if Sxx > 0 else 1.0
+
+    def loss(m, k):
+        return (Syy - 2*m*Sxy + m*m*Sxx)/n + (y_mean - m*centre - k)**2
+
+    def exact_gradient(p):
+        return np.array([-2*(Sxy/(n*scale) - p[0]), -2*(y_mean - p[1])])
+
+    size = x.size if batch_size is None else batch_size
+    starts = np.arange(0, x.size, size)
+    rng = np.random.default_rng(seed)
+    update = _updates(method, learning_rate, beta, beta2, epsilon)
+    # a, b for a*(x - centre)/scale + b, starting from the flat line through
+    # the mean of y, whose intercept would otherwise take Adam's small
+    # steps thousands of epochs to reach
+    p = np.array([0.0, y_mean])
+    trace = [(0.0, y_mean, loss(0, y_mean), 0.0)]
+    start_time = time.perf_counter()
+    epoch = 0
+    while epoch < epochs and np.linalg.norm(exact_gradient(p)) > tol:
+        epoch += 1
+        if batch_size is None:
+            total, count = np.zeros(2), 0
+            for start in range(0, x.size, block_size):
+                g, rows = _gradient(x[start:start + block_size], y[start:start + block_size],
+                                    p, centre, scale)
+                total += g
+                count += rows
+            p = update(p, total/count)
+        else:
+            for start in rng.permutation(starts):
+                g, rows = _gradient(x[start:start + size], y[start:start + size],
+                                    p, centre, scale)
+                if rows:
+                    p = update(p, g/rows)
+        m = p[0]/scale
+        k = p[1] - m*centre
+        trace.append((m, k, loss(m, k), time.perf_counter() - start_time))
+
+    m, k = p[0]/scale, p[1] - p[0]/scale*centre
+    trace = Trace(*(np.array(column) for column in zip(*trace)))
+    return Training(m, k, loss(m, k), exact, trace, epoch, time.perf_counter() - start_time)
@@ -0,0 +1,207 @@
+"""
+Ensemble forecasts
+==================
+
+A single simulation of the SIR model gives a single epidemic curve, but in
+practice we do not know :math:`\\beta`, :math:`\\gamma` or :math:`\\delta`
+exactly. Drawing the parameters from distributions and simulating many
+epidemics gives a band of curves: here the 5%, 50% and 95% quantiles at every
+time point.
+
+Members are simulated in batches with the batched integrator from
+:mod:`kujenga.sweep`, spread over a pool of processes. Rather than keeping
+every trajectory, each batch is added to a histogram of the values at each
+time point, held in shared memory. The histogram takes the same memory
+whatever the size of the ensemble, batches from different processes simply
+add up, and the quantiles are read off it at the end. They are accurate to
+within one histogram bin, ``(value_range[1] - value_range[0])/bins``.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from scipy import stats
+>>> from kujenga.ensemble import run_ensemble
+>>> t = np.linspace(0, 100, 1000)
+>>> result = run_ensemble('SIR', {'beta': stats.gamma(a=50, scale=1/100),
+...                               'gamma': stats.uniform(1/10, 1/20)},
+...                       [0.9999, 0.0001, 0.0], t, n=100000)
+>>> I_low, I_median, I_high = result.quantiles[:, :, 1]
+"""
+
+import multiprocessing
+import numbers
+from collections import namedtuple
+
+import numpy as np
+
+from . import compartments, sweep
+
+
+EnsembleResult = namedtuple('EnsembleResult', ['t', 'q', 'quantiles', 'mean', 'n'])
+EnsembleResult.__doc__ = """\
+Summary of an ensemble: for each quantile in ``q``, ``quantiles[k]`` is an
+array of shape ``(len(t), number of compartments)``; ``mean`` has the same
+shape and ``n`` is the number of members."""
+
+_models = {'SIR': compartments.sir, 'SEIR': compartments.seir}
+
+
+def _sample(distribution, size, rng):
+    if isinstance(distribution, numbers.Number):
+        return np.full(size, float(distribution))
+    if hasattr(distribution, 'rvs'):             # a scipy.stats distribution
+        return np.asarray(distribution.rvs(size=size, random_state=rng), dtype=float)
+    return np.asarray(distribution(rng, size), dtype=float)
+
+
+class _Accumulator:
+    """
+    Histogram counts and sums of the values at each time point, stored in
+    ``buffer``, a ``multiprocessing.RawArray`` shared between processes.
+    """
+
+    def __init__(self, shape, bins, buffer=None):
+        n_counts = int(np.prod(shape))*bins
+        if buffer is None:
+            buffer = multiprocessing.RawArray('d', n_counts + int(np.prod(shape)))
+        self.buffer = buffer
+        values = np.frombuffer(buffer, dtype=np.float64)
+        self.counts = values[:n_counts].view(np.int64).reshape(tuple(shape) + (bins,))
+        self.sums = values[n_counts:].reshape(shape)
+
+
+# State of each worker process, set by _initialise
+_worker = {}
+
+
+def _initialise(spec, distributions, X0, t, options, value_range, bins, buffer, lock):
+    _worker.update(
+        dXdt=spec.compile().dXdt, parameters=spec.parameters,
+        distributions=distributions, X0=X0, t=t, options=options,
+        value_range=value_range, bins=bins, lock=lock,
+        accumulator=_Accumulator((t.size, X0.size), bins, buffer))
+
+
+def _run_batch(task):
+    seed, size = task
+    w = _worker
+    rng = np.random.default_rng(seed)
+    args = tuple(_sample(w['distributions'][p], size, rng) for p in w['parameters'])
+    dXdt = w['dXdt']
+    X = sweep.rk4(lambda X, t, *p: dXdt(X.T, t, *p).T, w['X0'], w['t'],
+                  args=args, **w['options'])
+    lo, hi = w['value_range']
+    bins = w['bins']
+    index = np.clip(((X - lo)*(bins/(hi - lo))).astype(np.int64), 0, bins - 1)
+    # One bincount over (time, compartment, bin) for the whole batch
+    index += bins*np.arange(X.shape[1]*X.shape[2]).reshape(X.shape[1:])
+    counts = np.bincount(index.ravel(), minlength=X.shape[1]*X.shape[2]*bins)
+    sums = X.sum(axis=0)
+    accumulator = w['accumulator']
+    with w['lock']:
+        accumulator.counts += counts.reshape(accumulator.counts.shape)
+        accumulator.sums += sums
+    return size
+
+
+def histogram_quantiles(counts, q, value_range):
+    """
+    Quantiles ``q`` of the values in a histogram with equal bins on
+    ``value_range`` along its last axis, interpolating linearly within bins.
+    """
+    lo, hi = value_range
+    bins = counts.shape[-1]
+    cumulative = np.cumsum(counts, axis=-1)
+    n = cumulative[..., -1:]
+    out = []
+    for level in np.atleast_1d(q):
+        target = level*n
+        k = np.minimum(np.sum(cumulative < target, axis=-1, keepdims=True), bins - 1)
+        before = np.take_along_axis(cumulative, k, axis=-1) - \
+            np.take_along_axis(counts, k, axis=-1)
+        in_bin = np.maximum(np.take_along_axis(counts, k, axis=-1), 1)
+        fraction = np.clip((target - before)/in_bin, 0, 1)
+        out.append((lo + (k + fraction)*(hi - lo)/bins)[..., 0])
+    return np.array(out)
+
+
+def run_ensemble(model, distributions, X0, t, n=10000, q=(0.05, 0.5, 0.95),
+                 batch_size=1000, processes=None, seed=None, bins=2000,
+                 value_range=(0, 1), max_step=0.1):
+    """
+    Simulate an ensemble of epidemics with random parameters.
+
+    Parameters
+    ----------
+    model : {'SIR', 'SEIR'} or CompartmentModel
+        The model to simulate.
+    distributions : dict
+        For each parameter of the model, a number, a ``scipy.stats``
+        distribution, or a function ``f(rng, size)`` returning samples. On
+        systems that start worker processes by spawning (Windows and macOS)
+        these functions must be defined at module level, not lambdas.
+    X0 : array_like
+        Initial state, shared by all members.
+    t : array_like
+        Output times.
+    n : int
+        Number of members.
+    q : sequence of float
+        Quantiles to report.
+    batch_size : int
+        Members simulated together in one batch.
+    processes : int or None
+        Number of worker processes. ``None`` uses every core, and 1 runs
+        everything in this process.
+    seed : int or None
+        Seed for the random numbers. Each batch has its own stream derived
+        from it, so results do not depend on ``processes``.
+    bins : int
+        Histogram bins over ``value_range``.
+    value_range : (float, float)
+        Range of the state values; population proportions are in ``(0, 1)``.
+        The histogram holds ``len(t)*len(X0)*bins`` counts.
+    max_step : float
+        Step size of the RK4 integration.
+
+    Returns
+    -------
+    EnsembleResult
+    """
+    spec = _models.get(model, model)
+    if not isinstance(spec, compartments.CompartmentModel):
+        raise ValueError('model must be %s or a CompartmentModel'
+                         % ' or '.join(repr(m) for m in _models))
+    missing = set(spec.parameters) - set(distributions)
+    if missing:
+        raise ValueError('no distribution given for %s' % ', '.join(sorted(missing)))
+    X0 = np.asarray(X0, dtype=float)
+    t = np.asarray(t, dtype=float)
+    sizes = [batch_size]*(n//batch_size) + ([n % batch_size] if n % batch_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+    options = {'max_step': max_step}
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+
+    accumulator = _Accumulator((t.size, X0.size), bins)
+    initargs = (spec, distributions, X0, t, options, value_range, bins,
+                accumulator.buffer, multiprocessing.Lock())
+    if processes <= 1:
+        _initialise(*initargs)
+        try:
+            for task in tasks:
+                _run_batch(task)
+        finally:
+            _worker.clear()
+    else:
+        with multiprocessing.Pool(processes, _initialise, initargs) as pool:
+            for _ in pool.imap_unordered(_run_batch, tasks):
+                pass
+
+    total = accumulator.counts[0, 0].sum()
+    return EnsembleResult(t, np.asarray(q, dtype=float),
+                          histogram_quantiles(accumulator.counts, q, value_range),
+                          accumulator.sums/total, int(total))
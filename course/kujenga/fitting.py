@@ -0,0 +1,245 @@
+"""
+Fitting models to case data
+===========================
+
+In lesson 1 we chose the line that best fits the happiness data by making
+the sum of squared distances as small as possible. The same idea fits the
+epidemic models to the number of new cases reported each day: choose
+:math:`\\beta`, :math:`\\gamma` (and :math:`\\delta` for SEIR) so that the
+simulated new infections are as close as possible to the observed ones.
+
+Unlike a straight line there is no formula for the best parameters, so
+they are found by an optimiser that needs to know how the fit changes when
+each parameter changes. Rather than re-solving the model once per
+parameter with a small nudge (finite differences), the sensitivities
+:math:`s_k = \\partial X/\\partial\\theta_k` are solved alongside the model,
+
+.. math::
+
+    \\frac{ds_k}{dt} = J(X)\\, s_k + \\frac{\\partial f}{\\partial\\theta_k},
+
+using the Jacobians in :mod:`kujenga.models`. One solve then gives both the
+fit and its gradient. The parameters are fitted on a log scale, which keeps
+them positive, and the fit can be restarted from several guesses in
+parallel in case the optimiser gets stuck.
+
+What counts as a case depends on the model. For SIR and the social
+epidemic a case is a new infection, the fall in :math:`S`. In the SEIR
+model people are infected (move from :math:`S` to :math:`E`) some days
+before they fall ill and can be reported, so a case is an *onset*, a move
+from :math:`E` to :math:`I` at the rate :math:`\\delta E`, which is the
+fall in :math:`S + E`. These are the defaults in ``case_compartments``,
+and the ``compartment`` argument of :func:`fit` counts something else.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga.fitting import fit
+>>> t = np.arange(0, 101)
+>>> cases = np.loadtxt('cases.txt')            # len(t) - 1 daily counts
+>>> result = fit('SIR', t, cases, X0=[0.9999, 0.0001, 0.0],
+...              population=1000000, starts=8, processes=None)
+>>> beta, gamma = result.params
+"""
+
+import inspect
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+from scipy import integrate, optimize
+
+from . import models
+
+
+FitResult = namedtuple('FitResult', ['params', 'cost', 'incidence', 'success', 'fits'])
+FitResult.__doc__ = """\
+The best fit: the parameters, half the sum of squared residuals, the
+fitted new cases per interval, whether the optimiser converged, and the
+``scipy.optimize`` result from every start."""
+
+# (dXdt, jacobian, parameter_jacobian) for the models that can be fitted by name
+fittable_models = {
+    'SIR': (models.sir_dXdt, models.sir_jacobian, models.sir_parameter_jacobian),
+    'SEIR': (models.seir_dXdt, models.seir_jacobian, models.seir_parameter_jacobian),
+    'social epidemic': (models.social_dXdt, models.social_jacobian,
+                        models.social_parameter_jacobian),
+}
+
+
+# The compartments whose fall counts the new cases, see incidence()
+case_compartments = {
+    'SIR': 0,
+    'SEIR': (0, 1),
+    'social epidemic': 0,
+}
+
+
+def _model(model):
+    if isinstance(model, str):
+        if model not in fittable_models:
+            raise ValueError('unknown model %r, expected one of %s'
+                             % (model, ', '.join(fittable_models)))
+        return fittable_models[model]
+    return model
+
+
+def sensitivities(model, X0, t, args, rtol=1e-8, atol=1e-10):
+    """
+    Solve a model together with its forward sensitivity equations.
+
+    Parameters
+    ----------
+    model : str or tuple
+        A name from ``fittable_models`` or a tuple
+        ``(dXdt, jacobian, parameter_jacobian)`` of functions called as
+        ``f(X, t, *args)``.
+    X0 : array_like, shape ``(d,)``
+        Initial state, which does not depend on the parameters.
+    t : array_like
+        Times to report.
+    args : sequence of float
+        The ``p`` parameters.
+
+    Returns
+    -------
+    X : ndarray, shape ``(len(t), d)``
+    dX : ndarray, shape ``(len(t), d, p)``
+        ``dX[i, j, k]`` is the derivative of ``X[i, j]`` with respect to
+        ``args[k]``.
+    """
+    dXdt, jacobian, parameter_jacobian = _model(model)
+    X0 = np.asarray(X0, dtype=float)
+    d, p = X0.size, len(args)
+
+    def rhs(Y, t):
+        X, s = Y[:d], Y[d:].reshape(d, p)
+        ds = jacobian(X, t, *args) @ s + parameter_jacobian(X, t, *args)
+        return np.concatenate([dXdt(X, t, *args), ds.ravel()])
+
+    Y0 = np.concatenate([X0, np.zeros(d*p)])
+    Y = integrate.odeint(rhs, Y0, t, rtol=rtol, atol=atol)
+    return Y[:, :d], Y[:, d:].reshape(len(t), d, p)
+
+
+def incidence(X, dX=None, compartment=0, population=1):
+    """
+    New cases in each interval between reported times, the fall in the
+    ``compartment`` times the ``population``. By default these are new
+    infections, the fall in the susceptibles; a sequence of compartments
+    counts the fall in their total, e.g. ``(0, 1)`` for onsets in the SEIR
+    model. With the sensitivities ``dX`` also returns the derivatives of
+    each count with respect to the parameters, shape ``(len(t) - 1, p)``.
+    """
+    compartments = np.atleast_1d(compartment)
+    new = -population*np.diff(X[:, compartments].sum(axis=1))
+    if dX is None:
+        return new
+    return new, -population*np.diff(dX[:, compartments].sum(axis=1), axis=0)
+
+
+def _fit_from(task):
+    model, t, cases, X0, compartment, population, start, bounds, options = task
+    rtol, atol = options.get('rtol', 1e-8), options.get('atol', 1e-10)
+    cached = {}
+
+    def solve(log_params):
+        key = log_params.tobytes()
+        if key not in cached:
+            params = np.exp(log_params)
+            X, dX = sensitivities(model, X0, t, params, rtol, atol)
+            new, dnew = incidence(X, dX, compartment, population)
+            # the chain rule for fitting log(params)
+            cached.clear()
+            cached[key] = (new - cases, dnew*params)
+        return cached[key]
+
+    return optimize.least_squares(lambda x: solve(x)[0], np.log(start),
+                                  jac=lambda x: solve(x)[1], bounds=np.log(bounds),
+                                  method='trf', x_scale='jac',
+                                  max_nfev=options.get('max_nfev'))
+
+
+def fit(model, t, cases, X0, guess=None, bounds=None, compartment=None, population=1,
+        starts=1, processes=1, seed=None, **options):
+    """
+    Fit the parameters of an epidemic model to counts of new cases.
+
+    Parameters
+    ----------
+    model : str or tuple
+        ``'SIR'``, ``'SEIR'``, ``'social epidemic'`` or a tuple
+        ``(dXdt, jacobian, parameter_jacobian)``.
+    t : array_like, shape ``(T,)``
+        Reporting times, starting at the time of ``X0``.
+    cases : array_like, shape ``(T - 1,)``
+        New cases reported in each interval ``(t[i-1], t[i]]``.
+    X0 : array_like
+        Initial proportions in each compartment.
+    guess : sequence of float, optional
+        The first starting point. Other starts are drawn log-uniformly
+        between the bounds.
+    bounds : tuple of two sequences, optional
+        Lower and upper bounds on each parameter, by default 1e-4 to 10.
+    compartment : int or sequence of int, optional
+        The compartment, or compartments, whose fall counts the cases, as
+        for :func:`incidence`. By default new infections (the fall in the
+        first compartment, the susceptibles) for SIR, the social epidemic
+        and models given as functions, and onsets (the fall in ``S + E``)
+        for SEIR.
+    population : float
+        Scales proportions to case counts.
+    starts : int
+        Number of starting points.
+    processes : int or None
+        Number of worker processes for the starts. ``None`` uses every
+        core. As with :mod:`kujenga.ensemble`, functions passed as
+        ``model`` must then be defined at module level.
+    seed : int, optional
+        Seed for the random starts.
+    **options
+        ``rtol`` and ``atol`` for the solver, ``max_nfev`` for the
+        optimiser.
+
+    Returns
+    -------
+    FitResult
+    """
+    t = np.asarray(t, dtype=float)
+    cases = np.asarray(cases, dtype=float)
+    if cases.shape != (t.size - 1,):
+        raise ValueError('expected %d case counts for %d times, got %s'
+                         % (t.size - 1, t.size, cases.shape))
+    if guess is not None:
+        p = len(guess)
+    else:                            # dXdt(X, t, *params)
+        p = len(inspect.signature(_model(model)[0]).parameters) - 2
+    if bounds is None:
+        bounds = (np.full(p, 1e-4), np.full(p, 10.0))
+    if compartment is None:
+        compartment = case_compartments.get(model, 0) if isinstance(model, str) else 0
+    lower, upper = np.broadcast_to(bounds[0], (p,)), np.broadcast_to(bounds[1], (p,))
+
+    rng = np.random.default_rng(seed)
+    points = np.exp(rng.uniform(np.log(lower), np.log(upper), size=(starts, p)))
+    if guess is not None:
+        points[0] = guess
+    tasks = [(model, t, cases, X0, compartment, population, start, (lower, upper), options)
+             for start in points]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or starts == 1:
+        fits = [_fit_from(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(min(processes, starts)) as pool:
+            fits = pool.map(_fit_from, tasks)
+
+    best = min(fits, key=lambda f: f.cost)
+    params = np.exp(best.x)
+    X, _ = sensitivities(model, X0, t, params, **{k: v for k, v in options.items()
+                                                  if k in ('rtol', 'atol')})
+    return FitResult(params, best.cost, incidence(X, compartment=compartment,
+                                                  population=population),
+                     best.success, fits)
@@ -0,0 +1,163 @@
+"""
+Interventions
+=============
+
+In the SEIR exercise, restrictions start when the proportion infected reaches
+a threshold :math:`I_T`. The lesson does this by simulating the whole
+epidemic, looking up the first time point where ``I >= IT``, and then
+simulating again from there with the new :math:`\\beta`. That throws away
+everything computed after the threshold and snaps the switch to the time grid.
+
+Here the threshold is an *event*: the solver locates the exact time the
+threshold is crossed by root finding on its dense output, stops there,
+switches parameters and carries on from the same state. Results are written
+straight into one output array on the requested time grid.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga import models
+>>> from kujenga.interventions import Intervention, simulate
+>>> t = np.linspace(0, 365, 1000)
+>>> X0 = [0.999, 0.0, 0.001, 0.0]
+>>> lockdown = Intervention(component=2, threshold=0.01, params={'beta': 1/10})
+>>> X, switches = simulate(models.seir_dXdt, X0, t,
+...                        {'beta': 1/5, 'gamma': 1/7, 'delta': 1/3}, [lockdown])
+>>> t_switch, X_switch = switches[0]
+"""
+
+import numpy as np
+from scipy import integrate
+
+from .models import seir_dXdt
+
+
+class Intervention:
+    """
+    A one-off change of parameters triggered when a state crosses a threshold.
+
+    Parameters
+    ----------
+    component : int
+        Index of the state variable to watch, e.g. 2 for :math:`I` in SEIR.
+    threshold : float
+        The intervention starts when ``X[component]`` crosses this value.
+    params : dict
+        Parameter values to use from then on. Parameters not named here keep
+        their current values.
+    direction : {1, -1}
+        Trigger on an upward (1) or downward (-1) crossing.
+    """
+
+    def __init__(self, component, threshold, params, direction=1):
+        if direction not in (1, -1):
+            raise ValueError('direction must be 1 or -1')
+        self.component = component
+        self.threshold = threshold
+        self.params = dict(params)
+        self.direction = direction
+
+    def __repr__(self):
+        return 'Intervention(component=%r, threshold=%r, params=%r, direction=%r)' % (
+            self.component, self.threshold, self.params, self.direction)
+
+    def reached(self, X):
+        """True if the state ``X`` is already past the threshold."""
+        return self.direction*(X[self.component] - self.threshold) >= 0
+
+    def event(self):
+        """The event function in the form expected by ``solve_ivp``."""
+        def crossing(t, X):
+            return X[self.component] - self.threshold
+        crossing.terminal = True
+        crossing.direction = self.direction
+        return crossing
+
+
+def simulate(dXdt, X0, t, params, interventions=(), method='LSODA',
+             rtol=1e-6, atol=1e-9):
+    """
+    Simulate ``dXdt`` on the time grid ``t``, applying interventions as their
+    thresholds are crossed.
+
+    Parameters
+    ----------
+    dXdt : callable
+        ``dXdt(X, t, **params)``, for example :func:`kujenga.models.seir_dXdt`.
+    X0 : array_like
+        Initial state.
+    t : array_like
+        Increasing output times, ``t[0]`` being the initial time.
+    params : dict
+        Parameter values at the start.
+    interventions : sequence of Intervention
+        Each intervention is applied once, the first time its threshold is
+        crossed, in whatever order that happens. An intervention whose
+        threshold is already passed at the start is applied at ``t[0]``.
+    method, rtol, atol
+        Passed on to ``scipy.integrate.solve_ivp``.
+
+    Returns
+    -------
+    X : ndarray, shape ``(len(t), len(X0))``
+        The solution at the times ``t``.
+    switches : list of (float, ndarray)
+        The exact time and state at which each intervention was applied, in
+        the order they happened.
+    """
+    t = np.asarray(t, dtype=float)
+    X = np.asarray(X0, dtype=float)
+    out = np.empty((t.size, X.size))
+    params = dict(params)
+    pending = list(interventions)
+    switches = []
+    t_start = t[0]
+    i = 0                                   # next row of out to fill
+    while True:
+        # Interventions whose threshold is already reached start straight away
+        for intervention in [p for p in pending if p.reached(X)]:
+            params.update(intervention.params)
+            pending.remove(intervention)
+            switches.append((t_start, X.copy()))
+        if i < t.size and t[i] == t_start:
+            out[i] = X
+            i += 1
+        if i == t.size:
+            break
+        current = dict(params)
+        sol = integrate.solve_ivp(lambda s, Y: dXdt(Y, s, **current),
+                                  (t_start, t[-1]), X, method=method,
+                                  t_eval=t[i:], events=[p.event() for p in pending],
+                                  rtol=rtol, atol=atol)
+        if not sol.success:
+            raise RuntimeError(sol.message)
+        out[i:i + sol.t.size] = sol.y.T
+        i += sol.t.size
+        if sol.status != 1:                 # reached the end of t
+            break
+        fired = [k for k, te in enumerate(sol.t_events) if te.size]
+        intervention = pending.pop(fired[0])
+        t_start = sol.t_events[fired[0]][0]
+        X = sol.y_events[fired[0]][0].copy()
+        params.update(intervention.params)
+        switches.append((t_start, X.copy()))
+    return out, switches
+
+
+def seir_restrictions(X0, t, IT, beta=1/5, beta_restricted=1/10, gamma=1/7,
+                      delta=1/3):
+    """
+    The SEIR restrictions exercise from lesson 2: :math:`\\beta` drops from
+    ``beta`` to ``beta_restricted`` when :math:`I` first reaches ``IT``.
+
+    Returns ``X`` on the grid ``t`` and the exact time restrictions started
+    (``nan`` if :math:`I` never reaches ``IT``).
+    """
+    restrictions = Intervention(component=2, threshold=IT,
+                                params={'beta': beta_restricted})
+    X, switches = simulate(seir_dXdt, X0, t,
+                           {'beta': beta, 'gamma': gamma, 'delta': delta},
+                           [restrictions])
+    t_switch = switches[0][0] if switches else np.nan
+    return X, t_switch
@@ -0,0 +1,159 @@
+"""
+Compiled models
+===============
+
+Each ``dXdt`` in lesson 2 is a Python function that builds a new
+``np.array`` every time it is called. With only three or four compartments
+almost all the time goes on calling Python and making small arrays, not on
+the arithmetic, and ``odeint`` calls ``dXdt`` thousands of times.
+
+If `numba <https://numba.pydata.org>`_ is installed the lesson models here
+are compiled to machine code, together with a fixed step fourth order
+Runge-Kutta loop, so a whole simulation runs without returning to Python.
+Without numba :func:`odeint` simply calls ``scipy.integrate.odeint`` with
+the models from :mod:`kujenga.models`, so code using it works either way.
+Compare the two with ``python -m kujenga.benchmarks``.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga import jit
+>>> t = np.linspace(0, 100, 1000)
+>>> X = jit.odeint('SIR', [0.9999, 0.0001, 0.0], t, (1/2, 1/7))
+>>> jit.available                  # True if numba compiled it
+"""
+
+import numpy as np
+from scipy import integrate
+
+from . import models
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+
+def _jit(f):
+    if available:
+        return numba.njit(cache=True)(f)
+    return f
+
+
+# The lesson models, writing dXdt into ``out`` with the parameters in the
+# array ``p``, so that they create no arrays of their own.
+
+@_jit
+def _sir(X, t, p, out):
+    infection = p[0]*X[0]*X[1]
+    recovery = p[1]*X[1]
+    out[0] = -infection
+    out[1] = infection - recovery
+    out[2] = recovery
+
+
+@_jit
+def _seir(X, t, p, out):
+    infection = p[0]*X[0]*X[2]
+    onset = p[2]*X[1]
+    recovery = p[1]*X[2]
+    out[0] = -infection
+    out[1] = infection - onset
+    out[2] = onset - recovery
+    out[3] = recovery
+
+
+@_jit
+def _social(X, t, p, out):
+    infection = p[0]*X[0]*X[1]
+    recovery = p[1]*X[1] + p[2]*X[1]*X[2]
+    out[0] = -infection
+    out[1] = infection - recovery
+    out[2] = recovery
+
+
+@_jit
+def _lotka_volterra(X, t, p, out):
+    out[0] = p[0]*X[0] - p[1]*X[0]*X[1]
+    out[1] = p[2]*X[0]*X[1] - p[3]*X[1]
+
+
+compiled_models = {
+    'SIR': _sir,
+    'SEIR': _seir,
+    'social epidemic': _social,
+    'rabbits and foxes': _lotka_volterra,
+}
+
+
+def _make_rk4(rhs):
+    @_jit
+    def rk4(X0, t, p, max_step):
+        d = X0.size
+        X = np.empty((t.size, d))
+        x = X0.copy()
+        k1, k2, k3, k4 = np.empty(d), np.empty(d), np.empty(d), np.empty(d)
+        y = np.empty(d)
+        X[0] = x
+        for i in range(1, t.size):
+            steps = max(1, int(np.ceil((t[i] - t[i-1])/max_step)))
+            h = (t[i] - t[i-1])/steps
+            for n in range(steps):
+                s = t[i-1] + n*h
+                rhs(x, s, p, k1)
+                for j in range(d):
+                    y[j] = x[j] + 0.5*h*k1[j]
+                rhs(y, s + 0.5*h, p, k2)
+                for j in range(d):
+                    y[j] = x[j] + 0.5*h*k2[j]
+                rhs(y, s + 0.5*h, p, k3)
+                for j in range(d):
+                    y[j] = x[j] + h*k3[j]
+                rhs(y, s + h, p, k4)
+                for j in range(d):
+                    x[j] += h*(k1[j] + 2*k2[j] + 2*k3[j] + k4[j])/6
+            X[i] = x
+        return X
+    return rk4
+
+
+# RK4 loops for each model, made (and compiled) the first time they are used
+_solvers = {}
+
+
+def _model(model):
+    if model not in compiled_models:
+        raise ValueError('unknown model %r, expected one of %s'
+                         % (model, ', '.join(compiled_models)))
+    return model
+
+
+def rk4(model, X0, t, args, max_step=0.01):
+    """
+    Fixed step fourth order Runge-Kutta for one of the ``compiled_models``,
+    taking steps of at most ``max_step`` between the times in ``t``.
+    Without numba this runs, slowly, as plain Python.
+
+    Returns an array of shape ``(len(t), len(X0))``, like ``odeint``.
+    """
+    model = _model(model)
+    if model not in _solvers:
+        _solvers[model] = _make_rk4(compiled_models[model])
+    return _solvers[model](np.asarray(X0, dtype=float), np.asarray(t, dtype=float),
+                           np.asarray(args, dtype=float), float(max_step))
+
+
+def odeint(model, X0, t, args, max_step=0.01, **options):
+    """
+    Solve one of the lesson models by name: with the compiled :func:`rk4`
+    when numba is available, otherwise with ``scipy.integrate.odeint``, to
+    which any ``options`` are passed.
+    """
+    model = _model(model)
+    if available:
+        return rk4(model, X0, t, args, max_step)
+    dXdt = models.lesson_examples[model][0]
+    return integrate.odeint(dXdt, X0, t, args=tuple(args), **options)
@@ -0,0 +1,262 @@
+"""
+Rabbits and foxes over long times
+=================================
+
+The rabbits and foxes go round and round the same closed cycle for ever,
+because the quantity
+
+.. math::
+
+    V(R, F) = cR - d\\ln R + bF - a\\ln F
+
+never changes. General purpose solvers like ``integrate.odeint`` do not know
+this. Over a long simulation their small errors add up, and the solution
+slowly spirals off the cycle unless the tolerances are made very tight.
+
+In the logarithms :math:`u = \\ln R` and :math:`v = \\ln F` the model becomes
+
+.. math::
+
+    \\frac{du}{dt} = a - b e^v, \\qquad \\frac{dv}{dt} = c e^u - d,
+
+a Hamiltonian system with energy :math:`H(u, v) = V`, in which the rate of
+change of each variable depends only on the other. Such systems can be
+solved by alternately updating :math:`u` and :math:`v` (the leapfrog, or
+Störmer-Verlet, method). This is symplectic: it keeps a quantity very close
+to :math:`V` fixed for ever, so the solution stays on the cycle even with
+large steps. Working with logarithms also means the populations can never
+become negative.
+
+The period and size of the cycle can be found without plotting it, using
+a Poincaré section: a line the cycle crosses once each way per turn. We use
+the nullclines. Each time :math:`R` passes :math:`d/c` the foxes are at
+their fewest (rabbits increasing) or most (rabbits decreasing), and each time
+:math:`F` passes :math:`a/b` the rabbits are at their most or fewest. The
+time between two crossings in the same direction is the period.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga import lotkavolterra
+>>> t = np.linspace(0, 10000, 100001)
+>>> X = lotkavolterra.integrate([10, 2], t, a=5, b=1, c=0.15, d=1, h=0.01)
+>>> R, F = X.T
+>>> c = np.linspace(0.1, 0.5, 100000)
+>>> summary = lotkavolterra.cycles([10, 2], a=5, b=1, c=c, d=1)
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+
+def first_integral(X, a, b, c, d):
+    """The conserved quantity :math:`V` for states ``X = [R, F]`` along the last axis."""
+    X = np.asarray(X, dtype=float)
+    R, F = X[..., 0], X[..., 1]
+    return c*R - d*np.log(R) + b*F - a*np.log(F)
+
+
+# Coefficients of the fourth order Yoshida composition of leapfrog steps
+_cube_root = 2**(1/3)
+_yoshida = (1/(2 - _cube_root), -_cube_root/(2 - _cube_root), 1/(2 - _cube_root))
+
+
+def integrate(X0, t, a, b, c, d, h=0.01, order=2):
+    """
+    Simulate the rabbits and foxes with a symplectic method in log
+    coordinates.
+
+    Parameters
+    ----------
+    X0 : array_like
+        Initial ``[R, F]``, shape ``(2,)``, or ``(N, 2)`` to simulate ``N``
+        cycles at once.
+    t : array_like
+        Increasing output times, ``t[0]`` being the initial time.
+    a, b, c, d : float or array_like
+        The model parameters. Arrays of length ``N`` simulate ``N``
+        parameter sets at once.
+    h : float
+        Largest step. Each interval between output times is split into the
+        fewest equal steps no longer than this.
+    order : {2, 4}
+        Leapfrog (2) or its fourth order Yoshida composition (4), which takes
+        three leapfrog steps per step but is far more accurate for the same
+        ``h``.
+
+    Returns
+    -------
+    X : ndarray, shape ``(len(t), 2)`` or ``(N, len(t), 2)``
+    """
+    if order == 2:
+        weights = (1.0,)
+    elif order == 4:
+        weights = _yoshida
+    else:
+        raise ValueError('order must be 2 or 4')
+    t = np.asarray(t, dtype=float)
+    X0 = np.asarray(X0, dtype=float)
+    batched = X0.ndim == 2 or any(np.ndim(p) > 0 for p in (a, b, c, d))
+    if batched:
+        # Arrays of states and parameters, stepped together with numpy
+        N = max([X0.shape[0] if X0.ndim == 2 else 1] +
+                [np.size(p) for p in (a, b, c, d)])
+        X0 = np.broadcast_to(X0, (N, 2))
+        a, b, c, d = (np.broadcast_to(np.asarray(p, dtype=float), (N,)) for p in (a, b, c, d))
+        u, v = np.log(X0[:, 0]), np.log(X0[:, 1])
+        exp = np.exp
+        out = np.empty((N, t.size, 2))
+    else:
+        # A single cycle, stepped with plain Python floats, which is much
+        # faster than numpy for single numbers
+        u, v = math.log(X0[0]), math.log(X0[1])
+        a, b, c, d = float(a), float(b), float(c), float(d)
+        exp = math.exp
+        out = np.empty((t.size, 2))
+    out[..., 0, 0] = exp(u)
+    out[..., 0, 1] = exp(v)
+    for k in range(1, t.size):
+        n = int(math.ceil((t[k] - t[k-1])/h - 1e-9))
+        step = (t[k] - t[k-1])/n
+        for _ in range(n):
+            for w in weights:
+                half = 0.5*w*step
+                u = u + half*(a - b*exp(v))
+                v = v + w*step*(c*exp(u) - d)
+                u = u + half*(a - b*exp(v))
+        out[..., k, 0] = exp(u)
+        out[..., k, 1] = exp(v)
+    return out
+
+
+CycleSummary = namedtuple('CycleSummary', ['period', 'R_min', 'R_max',
+                                           'F_min', 'F_max', 'phase'])
+CycleSummary.__doc__ = """\
+The period of the cycle, the smallest and largest numbers of rabbits and
+foxes on it, and the phase of the initial state: the fraction of a period
+since the foxes were last at their fewest. Each is an array with one entry
+per parameter set, ``nan`` where no cycle was found."""
+
+
+def _hermite(g0, g1, dg0, dg1, h, s):
+    # Cubic through (0, g0) and (h, g1) with slopes dg0 and dg1, at time s*h
+    return ((2*s**3 - 3*s**2 + 1)*g0 + (s**3 - 2*s**2 + s)*h*dg0 +
+            (-2*s**3 + 3*s**2)*g1 + (s**3 - s**2)*h*dg1)
+
+
+def _crossing(g0, g1, dg0, dg1, h, iterations=3):
+    # The fraction s of the step at which the cubic through g0, g1 is zero:
+    # linear interpolation followed by Newton's method on the cubic
+    s = g0/(g0 - g1)
+    for _ in range(iterations):
+        p = _hermite(g0, g1, dg0, dg1, h, s)
+        dp = ((6*s**2 - 6*s)*g0 + (3*s**2 - 4*s + 1)*h*dg0 +
+              (-6*s**2 + 6*s)*g1 + (3*s**2 - 2*s)*h*dg1)
+        s = np.clip(s - p/np.where(dp != 0, dp, 1), 0, 1)
+    return s
+
+
+def cycles(X0, a, b, c, d, steps_per_cycle=500, max_cycles=20):
+    """
+    Find the period and extremes of the rabbits and foxes cycle for many
+    parameter sets at once.
+
+    All parameter sets are stepped together with the leapfrog method of
+    :func:`integrate`. After each step, crossings of the nullclines
+    :math:`R=d/c` and :math:`F=a/b` are detected by a change of sign and
+    located within the step by root finding on a cubic that matches the
+    values and rates of change at both ends. Parameter sets are dropped from
+    the arrays as soon as their cycle is complete.
+
+    Parameters
+    ----------
+    X0 : array_like
+        Initial ``[R, F]``, shape ``(2,)`` or ``(N, 2)``.
+    a, b, c, d : float or array_like
+        Model parameters, broadcast together to length ``N``.
+    steps_per_cycle : int
+        Steps per period of the small oscillations about the equilibrium,
+        :math:`2\\pi/\\sqrt{ad}`, which sets a separate step for each
+        parameter set.
+    max_cycles : int
+        Give up, returning ``nan``, after this many small oscillation periods.
+        Cycles far from the equilibrium are slower than small oscillations.
+
+    Returns
+    -------
+    CycleSummary
+    """
+    X0 = np.asarray(X0, dtype=float)
+    arrays = np.broadcast_arrays(X0[..., 0], X0[..., 1], *(np.asarray(p, dtype=float)
+                                                           for p in (a, b, c, d)))
+    R0, F0, a, b, c, d = (np.array(x, dtype=float).ravel() for x in arrays)
+    N = R0.size
+    u_star, v_star = np.log(d/c), np.log(a/b)
+    h = 2*np.pi/np.sqrt(a*d)/steps_per_cycle
+
+    first = np.full(N, np.nan)          # time of the first fox minimum
+    period = np.full(N, np.nan)
+    R_min, R_max, F_min, F_max = (np.full(N, np.nan) for _ in range(4))
+
+    # Arrays for the parameter sets still running, with their indices
+    active = np.arange(N)
+    u, v = np.log(R0), np.log(F0)
+    A, B, C, D, H = a, b, c, d, h
+    Us, Vs = u_star, v_star
+    now = np.zeros(N)
+    for _ in range(steps_per_cycle*max_cycles):
+        du0, dv0 = A - B*np.exp(v), C*np.exp(u) - D
+        u_new = u + 0.5*H*du0
+        v_new = v + H*(C*np.exp(u_new) - D)
+        u_new = u_new + 0.5*H*(A - B*np.exp(v_new))
+        du1, dv1 = A - B*np.exp(v_new), C*np.exp(u_new) - D
+
+        gu0, gu1 = u - Us, u_new - Us
+        gv0, gv1 = v - Vs, v_new - Vs
+        # R crossing d/c: the foxes are at a minimum (R rising) or maximum
+        for rising in (True, False):
+            hit = (gu0 < 0) & (gu1 >= 0) if rising else (gu0 > 0) & (gu1 <= 0)
+            if hit.any():
+                s = _crossing(gu0[hit], gu1[hit], du0[hit], du1[hit], H[hit])
+                F = np.exp(_hermite(v[hit], v_new[hit], dv0[hit], dv1[hit], H[hit], s))
+                index = active[hit]
+                if rising:
+                    F_min[index] = F
+                    time = now[hit] + s*H[hit]
+                    seen = ~np.isnan(first[index])
+                    period[index[seen]] = time[seen] - first[index[seen]]
+                    first[index[~seen]] = time[~seen]
+                else:
+                    F_max[index] = F
+        # F crossing a/b: the rabbits are at a maximum (F rising) or minimum
+        for rising in (True, False):
+            hit = (gv0 < 0) & (gv1 >= 0) if rising else (gv0 > 0) & (gv1 <= 0)
+            if hit.any():
+                s = _crossing(gv0[hit], gv1[hit], dv0[hit], dv1[hit], H[hit])
+                R = np.exp(_hermite(u[hit], u_new[hit], du0[hit], du1[hit], H[hit], s))
+                if rising:
+                    R_max[active[hit]] = R
+                else:
+                    R_min[active[hit]] = R
+
+        u, v = u_new, v_new
+        now = now + H
+        finished = ~np.isnan(period[active])
+        if finished.any():
+            keep = ~finished
+            active = active[keep]
+            u, v, now = u[keep], v[keep], now[keep]
+            A, B, C, D, H, Us, Vs = (x[keep] for x in (A, B, C, D, H, Us, Vs))
+            if active.size == 0:
+                break
+
+    incomplete = np.isnan(period)
+    for x in (R_min, R_max, F_min, F_max):
+        x[incomplete] = np.nan
+    phase = np.mod(-first/period, 1)
+    shape = arrays[0].shape
+    return CycleSummary(*(x.reshape(shape) for x in
+                          (period, R_min, R_max, F_min, F_max, phase)))
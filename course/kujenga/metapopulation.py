@@ -0,0 +1,151 @@
+"""
+Metapopulation SIR
+==================
+
+The SIR model in lesson 2 assumes everyone mixes with everyone else
+(homogeneous mixing). An outbreak across a country is better described as
+many local epidemics, one per district, coupled by people travelling
+between them. With :math:`K` districts each has its own proportions
+:math:`S_k`, :math:`I_k` and :math:`R_k`, and the force of infection in
+district :math:`k` is
+
+.. math::
+
+    \\lambda_k = \\beta_k \\sum_j C_{kj} I_j,
+
+where :math:`C_{kj}` is how much contact people in district :math:`k` have
+with infectives in district :math:`j`. Then
+
+.. math::
+
+    \\frac{dS_k}{dt} = -\\lambda_k S_k, \\qquad
+    \\frac{dI_k}{dt} = \\lambda_k S_k - \\gamma_k I_k, \\qquad
+    \\frac{dR_k}{dt} = \\gamma_k I_k.
+
+Most districts only have contact with a few others, so :math:`C` is stored
+as a ``scipy.sparse`` matrix and the whole right hand side costs one sparse
+matrix-vector product. With :math:`C` the identity this is :math:`K`
+separate copies of the lesson model.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga.metapopulation import Metapopulation, ring_contacts
+>>> K = 10000
+>>> model = Metapopulation(ring_contacts(K, travel=0.05), beta=1/2, gamma=1/7)
+>>> I0 = np.zeros(K)
+>>> I0[0] = 0.001
+>>> X = model.simulate(model.initial_state(I0), np.linspace(0, 365, 366))
+>>> S, I, R = X[:, 0], X[:, 1], X[:, 2]      # each of shape (366, K)
+"""
+
+import numpy as np
+from scipy import integrate, sparse
+
+
+def normalise_rows(C):
+    """Scale each row of the sparse matrix ``C`` to sum to one."""
+    C = sparse.csr_matrix(C, dtype=float)
+    totals = np.asarray(C.sum(axis=1)).ravel()
+    totals[totals == 0] = 1
+    return sparse.diags(1/totals) @ C
+
+
+def ring_contacts(K, travel=0.05, neighbours=1):
+    """
+    Contacts for ``K`` districts in a ring: people spend a proportion
+    ``1 - travel`` of their contacts at home and share ``travel`` equally
+    among the ``neighbours`` nearest districts on each side. There must be
+    more than ``2*neighbours`` districts, so that these are all different.
+    """
+    if K <= 2*neighbours:
+        raise ValueError('a ring with %d neighbours on each side needs more than %d '
+                         'districts, got %d' % (neighbours, 2*neighbours, K))
+    diagonals = [np.full(K, 1 - travel)]
+    offsets = [0]
+    for k in range(1, neighbours + 1):
+        for offset in (k, -k, K - k, k - K):
+            diagonals.append(np.full(K - abs(offset), travel/(2*neighbours)))
+            offsets.append(offset)
+    return sparse.diags(diagonals, offsets, shape=(K, K), format='csr')
+
+
+class Metapopulation:
+    """
+    SIR epidemics in ``K`` districts coupled through a contact matrix.
+
+    Parameters
+    ----------
+    contact : sparse matrix, shape ``(K, K)``
+        :math:`C_{kj}`, contacts of district ``k`` with district ``j``.
+        Usually each row sums to one, see :func:`normalise_rows`.
+    beta, gamma : float or array_like
+        Transmission and recovery rates, the same everywhere or one per
+        district.
+
+    The state is a flat array ``[S_1..S_K, I_1..I_K, R_1..R_K]`` so that it
+    can be passed to any solver.
+    """
+
+    def __init__(self, contact, beta, gamma):
+        self.contact = sparse.csr_matrix(contact, dtype=float)
+        K = self.contact.shape[0]
+        if self.contact.shape != (K, K):
+            raise ValueError('the contact matrix must be square')
+        self.K = K
+        self.beta = np.broadcast_to(np.asarray(beta, dtype=float), (K,))
+        self.gamma = np.broadcast_to(np.asarray(gamma, dtype=float), (K,))
+
+    def initial_state(self, I0, R0=0):
+        """The flat state with proportions ``I0`` infected and ``R0``
+        recovered in each district, and everyone else susceptible."""
+        I0 = np.broadcast_to(np.asarray(I0, dtype=float), (self.K,))
+        R0 = np.broadcast_to(np.asarray(R0, dtype=float), (self.K,))
+        return np.concatenate([1 - I0 - R0, I0, R0])
+
+    def dXdt(self, X, t=0):
+        """Right hand side for the flat state ``X``."""
+        K = self.K
+        S, I = X[:K], X[K:2*K]
+        infection = self.beta*(self.contact @ I)*S
+        recovery = self.gamma*I
+        dX = np.empty_like(X)
+        dX[:K] = -infection
+        dX[K:2*K] = infection - recovery
+        dX[2*K:] = recovery
+        return dX
+
+    def jacobian(self, X, t=0):
+        """The sparse Jacobian of :meth:`dXdt`, for implicit solvers."""
+        K = self.K
+        S, I = X[:K], X[K:2*K]
+        force = sparse.diags(self.beta*(self.contact @ I))
+        spread = sparse.diags(self.beta*S) @ self.contact
+        recovery = sparse.diags(self.gamma)
+        return sparse.bmat([[-force, -spread, None],
+                            [force, spread - recovery, None],
+                            [None, recovery, sparse.csr_matrix((K, K))]], format='csr')
+
+    def simulate(self, X0, t, method='RK45', rtol=1e-6, atol=1e-9, **options):
+        """
+        Solve from the flat state ``X0`` with ``scipy.integrate.solve_ivp``.
+
+        Explicit methods such as ``'RK45'`` only need :meth:`dXdt`. For the
+        implicit ``'BDF'`` and ``'Radau'`` methods the sparse Jacobian is
+        passed as well.
+
+        Returns
+        -------
+        X : ndarray, shape ``(len(t), 3, K)``
+            ``X[:, 0]``, ``X[:, 1]`` and ``X[:, 2]`` are S, I and R in each
+            district over time.
+        """
+        t = np.asarray(t, dtype=float)
+        if method in ('BDF', 'Radau'):
+            options.setdefault('jac', lambda s, X: self.jacobian(X, s))
+        sol = integrate.solve_ivp(lambda s, X: self.dXdt(X, s), (t[0], t[-1]), X0,
+                                  method=method, t_eval=t, rtol=rtol, atol=atol, **options)
+        if not sol.success:
+            raise RuntimeError(sol.message)
+        return sol.y.T.reshape(t.size, 3, self.K)
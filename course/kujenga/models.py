@@ -0,0 +1,131 @@
+"""
+Lesson models
+=============
+
+The differential equations from lesson 2, their Jacobians and their derivatives
+with respect to the parameters, written with the parameters as arguments rather
+than as global variables, so they can be passed straight to
+``integrate.odeint(dXdt, X0, t, args=...)`` or to the other kujenga modules.
+
+Like the lesson versions, each ``dXdt`` also works when ``X`` is a list of
+arrays, for example a ``meshgrid`` used to draw arrows on a phase plane.
+"""
+
+import numpy as np
+
+
+def sir_dXdt(X, t, beta, gamma):
+    """The SIR model, with ``X = [S, I, R]``."""
+    return np.array([  - beta*X[0]*X[1] ,              #Susceptible X[0] is S
+                      beta*X[0]*X[1]   - gamma*X[1],   #Infectives X[1] is I
+                      gamma*X[1]])                     #Recovered X[2] is R
+
+
+def seir_dXdt(X, t, beta, gamma, delta):
+    """The SEIR model, with ``X = [S, E, I, R]``."""
+    return np.array([  - beta*X[0]*X[2] ,              #Susceptible X[0] is S
+                      beta*X[0]*X[2]   - delta*X[1],   #Exposed X[1] is E
+                      delta*X[1]   - gamma*X[2],       #Infectives X[2] is I
+                      gamma*X[2]])                     #Recovered X[3] is R
+
+
+def social_dXdt(X, t, b, c, d):
+    """The social epidemic model, where recovered people also persuade
+    infectives to recover, with ``X = [S, I, R]``."""
+    return np.array([  - b*X[0]*X[1] ,                         #Susceptible X[0] is S
+                      b*X[0]*X[1]   - c*X[1] - d*X[1]*X[2],    #Infectives X[1] is I
+                      c*X[1] + d*X[1]*X[2]])                   #Recovered X[2] is R
+
+
+def lotka_volterra_dXdt(X, t, a, b, c, d):
+    """The rabbits and foxes model, with ``X = [R, F]``."""
+    return np.array([ a*X[0]        - b*X[0]*X[1] ,      #Rabbits X[0] is R
+                      c*X[0]*X[1]   - d*X[1]])           #Foxes X[1] is F
+
+
+##############################################################################
+# Jacobians. Entry [i, j] is the derivative of dXdt[i] with respect to X[j].
+# Passing these to integrate.odeint as Dfun saves the solver from estimating
+# them by finite differences when the system is stiff.
+
+def sir_jacobian(X, t, beta, gamma):
+    """Jacobian of :func:`sir_dXdt`."""
+    S, I, R = X
+    return np.array([[-beta*I, -beta*S,         0],
+                     [ beta*I,  beta*S - gamma, 0],
+                     [      0,  gamma,          0]])
+
+
+def seir_jacobian(X, t, beta, gamma, delta):
+    """Jacobian of :func:`seir_dXdt`."""
+    S, E, I, R = X
+    return np.array([[-beta*I,       0, -beta*S, 0],
+                     [ beta*I,  -delta,  beta*S, 0],
+                     [      0,   delta,  -gamma, 0],
+                     [      0,       0,   gamma, 0]])
+
+
+def social_jacobian(X, t, b, c, d):
+    """Jacobian of :func:`social_dXdt`."""
+    S, I, R = X
+    return np.array([[-b*I, -b*S,             0],
+                     [ b*I,  b*S - c - d*R, -d*I],
+                     [    0, c + d*R,        d*I]])
+
+
+def lotka_volterra_jacobian(X, t, a, b, c, d):
+    """Jacobian of :func:`lotka_volterra_dXdt`."""
+    R, F = X
+    return np.array([[a - b*F,    -b*R],
+                     [    c*F, c*R - d]])
+
+
+##############################################################################
+# Derivatives with respect to the parameters. Entry [i, k] is the derivative
+# of dXdt[i] with respect to the k-th parameter. Together with the Jacobians
+# these give the forward sensitivity equations used by kujenga.fitting.
+
+def sir_parameter_jacobian(X, t, beta, gamma):
+    """Derivatives of :func:`sir_dXdt` with respect to ``(beta, gamma)``."""
+    S, I, R = X
+    return np.array([[-S*I,  0],
+                     [ S*I, -I],
+                     [   0,  I]])
+
+
+def seir_parameter_jacobian(X, t, beta, gamma, delta):
+    """Derivatives of :func:`seir_dXdt` with respect to ``(beta, gamma, delta)``."""
+    S, E, I, R = X
+    return np.array([[-S*I,  0,  0],
+                     [ S*I,  0, -E],
+                     [   0, -I,  E],
+                     [   0,  I,  0]])
+
+
+def social_parameter_jacobian(X, t, b, c, d):
+    """Derivatives of :func:`social_dXdt` with respect to ``(b, c, d)``."""
+    S, I, R = X
+    return np.array([[-S*I,  0,    0],
+                     [ S*I, -I, -I*R],
+                     [   0,  I,  I*R]])
+
+
+def lotka_volterra_parameter_jacobian(X, t, a, b, c, d):
+    """Derivatives of :func:`lotka_volterra_dXdt` with respect to ``(a, b, c, d)``."""
+    R, F = X
+    return np.array([[R, -R*F,   0,  0],
+                     [0,    0, R*F, -F]])
+
+
+# The lesson parameters, initial states and time grids, for each model as
+# (dXdt, jacobian, args, X0, t)
+lesson_examples = {
+    'SIR': (sir_dXdt, sir_jacobian, (1/2, 1/7),
+            np.array([0.9999, 0.0001, 0.0]), np.linspace(0, 100, 1000)),
+    'SEIR': (seir_dXdt, seir_jacobian, (1/5, 1/7, 1/9),
+             np.array([0.999, 0.0, 0.001, 0.0]), np.linspace(0, 400, 1000)),
+    'social epidemic': (social_dXdt, social_jacobian, (3.5, 1, 1),
+                        np.array([0.9999, 0.0001, 0.0]), np.linspace(0, 20, 1000)),
+    'rabbits and foxes': (lotka_volterra_dXdt, lotka_volterra_jacobian, (5, 1, 0.15, 1),
+                          np.array([10.0, 2.0]), np.linspace(0, 20, 1000)),
+}
@@ -0,0 +1,254 @@
+"""
+Several predictors
+==================
+
+The exercise in lesson 1 tries ``LogGDP``, ``SocialSupport``, ``Freedom``,
+``Generosity`` and ``Corruption`` one at a time. Happiness can also be
+predicted from several of them together,
+
+.. math::
+
+    y = k + m_1 x_1 + m_2 x_2 + \\dots + m_p x_p,
+
+again choosing the :math:`m_j` and :math:`k` that make the sum of squared
+distances smallest. :func:`fit` does this with a QR factorisation of the
+table of predictors (the design matrix), which is what ``ols`` does behind
+its formulas.
+
+Which predictors should be used? :func:`forward_selection` starts with none
+and adds whichever most reduces the sum of squares, and
+:func:`best_subsets` tries every combination. Neither refits from the data:
+both work from the matrix of sums of products of the (centred) columns,
+computed once, and read the coefficients and sum of squares of each fit
+from it. Adding a predictor updates that matrix in place, and combinations
+of predictors are solved in large batches.
+
+Example
+-------
+
+>>> from kujenga import multiple
+>>> X, y, names = multiple.design_matrix(happy, 'Happiness',
+...     ['LifeExp', 'LogGDP', 'SocialSupport', 'Freedom', 'Generosity', 'Corruption'])
+>>> multiple.fit(X, y, names).coefficients
+>>> for step in multiple.forward_selection(X, y, names):
+...     print(step.names, step.r2)
+"""
+
+import itertools
+from collections import namedtuple
+
+import numpy as np
+from scipy import linalg
+
+
+Fit = namedtuple('Fit', ['names', 'coefficients', 'intercept', 'sse', 'r2', 'n'])
+Fit.__doc__ = """\
+A least squares fit: the predictors used, their coefficients, the
+intercept, the sum of squared distances, :math:`R^2` and the number of
+rows."""
+
+
+# Columns of the happiness data that are not chosen as predictors by default
+not_predictors = ('Year', 'Standard deviation of ladder by country-year',
+                  'Standard deviation/Mean of ladder by country-year')
+
+
+def design_matrix(data, response, columns=None, exclude=not_predictors, coverage=0.75):
+    """
+    The predictors and response from a data frame, keeping only the rows
+    where none of them is missing.
+
+    Parameters
+    ----------
+    data : DataFrame
+    response : str
+        The column to predict.
+    columns : list of str, optional
+        The predictors, by default every other numeric column not in
+        ``exclude`` that is present in at least the fraction ``coverage``
+        of the rows. Every row missing any of the predictors is dropped, so
+        including the columns that are mostly missing, such as the trust
+        surveys in the happiness data, would leave only a handful of rows.
+    exclude : sequence of str
+        Columns never chosen by default: the year, which labels a row
+        rather than describing the country, and the spread of the
+        happiness answers, which is worked out from the response itself.
+    coverage : float
+        The least fraction of rows a column must have to be chosen by
+        default.
+
+    Returns
+    -------
+    X : ndarray, shape ``(n, p)``
+    y : ndarray, shape ``(n,)``
+    names : list of str
+    """
+    if columns is None:
+        numeric = data.select_dtypes('number')
+        present = numeric.notna().mean()
+        columns = [c for c in numeric.columns
+                   if c != response and c not in exclude and present[c] >= coverage]
+    columns = list(columns)
+    values = data[columns + [response]].to_numpy(dtype=float)
+    values = values[np.isfinite(values).all(axis=1)]
+    return values[:, :-1], values[:, -1], columns
+
+
+def _names(X, names):
+    if names is None:
+        return ['x%d' % j for j in range(X.shape[1])]
+    if len(names) != X.shape[1]:
+        raise ValueError('%d names given for %d predictors' % (len(names), X.shape[1]))
+    return list(names)
+
+
+def _check_rows(n, p):
+    if n <= p + 1:
+        raise ValueError('%d rows are too few to fit %d predictors and an intercept' % (n, p))
+
+
+def fit(X, y, names=None):
+    """
+    Least squares fit of ``y`` on the columns of ``X`` plus an intercept,
+    by QR factorisation.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if X.ndim == 1:
+        X = X[:, None]
+    names = _names(X, names)
+    n = X.shape[0]
+    _check_rows(n, X.shape[1])
+    Q, R = np.linalg.qr(np.column_stack([np.ones(n), X]))
+    coefficients = linalg.solve_triangular(R, Q.T @ y)
+    residuals = y - Q @ (Q.T @ y)
+    sse = residuals @ residuals
+    total = np.sum((y - y.mean())**2)
+    return Fit(names, coefficients[1:], coefficients[0], sse, 1 - sse/total, n)
+
+
+class _Gram:
+    """Sums of products of the centred and scaled columns of ``X`` and
+    ``y``: ``G`` between predictors, ``b`` with the response, ``yy`` of the
+    response with itself."""
+
+    def __init__(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.n = X.shape[0]
+        self.x_mean = X.mean(axis=0)
+        self.y_mean = y.mean()
+        Xc = X - self.x_mean
+        yc = y - self.y_mean
+        self.scale = np.sqrt(np.sum(Xc**2, axis=0))
+        self.scale[self.scale == 0] = 1
+        Xc /= self.scale
+        self.G = Xc.T @ Xc
+        self.b = Xc.T @ yc
+        self.yy = yc @ yc
+
+    def fit(self, names, subset, m, sse):
+        """The :class:`Fit` on the predictors ``subset`` from their
+        coefficients ``m`` on the scaled columns and the sum of squares."""
+        coefficients = np.asarray(m, dtype=float)/self.scale[subset]
+        intercept = self.y_mean - self.x_mean[subset] @ coefficients
+        sse = max(float(sse), 0.0)
+        return Fit([names[j] for j in subset], coefficients, intercept, sse,
+                   1 - sse/self.yy, self.n)
+
+
+def _sweep(A, k):
+    """Sweep the symmetric matrix ``A`` in place on row and column ``k``."""
+    d = A[k, k]
+    row = A[k]/d
+    column = A[:, k].copy()
+    A -= np.outer(column, row)
+    A[k] = row
+    A[:, k] = -column/d
+    A[k, k] = 1/d
+
+
+def forward_selection(X, y, names=None, max_predictors=None, tol=1e-10):
+    """
+    Add predictors one at a time, each time the one that most reduces the
+    sum of squared distances.
+
+    After each predictor is chosen the sums of products of the others are
+    replaced by those of their residuals on it (a Schur complement, the
+    *sweep* of the Gram matrix), so that the reduction from every remaining
+    candidate is one division. The swept matrix also holds the coefficients
+    of the chosen predictors and the sum of squared distances, so the data
+    are not refitted. Candidates that are (almost) combinations of those
+    already chosen, with residual sum of squares below ``tol``, are
+    skipped.
+
+    Returns
+    -------
+    list of Fit
+        The fit after each step.
+    """
+    X = np.asarray(X, dtype=float)
+    names = _names(X, names)
+    p = X.shape[1]
+    _check_rows(X.shape[0], p if max_predictors is None else min(max_predictors, p))
+    gram = _Gram(X, y)
+    # [[G, b], [b, yy]], swept on the chosen predictors
+    A = np.block([[gram.G, gram.b[:, None]], [gram.b[None, :], gram.yy]])
+    chosen = []
+    steps = []
+    for _ in range(p if max_predictors is None else min(max_predictors, p)):
+        variance = np.diag(A)[:p].copy()
+        usable = variance > tol
+        usable[chosen] = False
+        if not usable.any():
+            break
+        reduction = np.zeros(p)
+        reduction[usable] = A[:p, p][usable]**2/variance[usable]
+        k = int(np.argmax(reduction))
+        _sweep(A, k)
+        chosen.append(k)
+        steps.append(gram.fit(names, chosen, A[chosen, p], A[p, p]))
+    return steps
+
+
+def best_subsets(X, y, names=None, max_predictors=None, batch_size=100000):
+    """
+    The best combination of predictors of each size, trying every
+    combination.
+
+    For each combination the normal equations are taken from the Gram
+    matrix, computed once, and solved for ``batch_size`` combinations at a
+    time. The best fit of each size is made from its solution, without
+    going back to the data. With 20 predictors there are about a million
+    combinations.
+
+    Returns
+    -------
+    list of Fit
+        The best fit with 1, 2, ... ``max_predictors`` predictors.
+    """
+    X = np.asarray(X, dtype=float)
+    names = _names(X, names)
+    p = X.shape[1]
+    _check_rows(X.shape[0], p if max_predictors is None else min(max_predictors, p))
+    gram = _Gram(X, y)
+    best = []
+    for size in range(1, (p if max_predictors is None else min(max_predictors, p)) + 1):
+        combinations = itertools.combinations(range(p), size)
+        best_explained, best_subset, best_m = -np.inf, None, None
+        while True:
+            subsets = np.array(list(itertools.islice(combinations, batch_size)))
+            if subsets.size == 0:
+                break
+            G = gram.G[subsets[:, :, None], subsets[:, None, :]]
+            b = gram.b[subsets]
+            try:
+                m = np.linalg.solve(G, b[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:       # some combinations are collinear
+                m = np.einsum('ijk,ik->ij', np.linalg.pinv(G), b)
+            explained = np.einsum('ij,ij->i', b, m)
+            i = int(np.argmax(explained))
+            if explained[i] > best_explained:
+                best_explained, best_subset, best_m = explained[i], list(subsets[i]), m[i]
+        best.append(gram.fit(names, best_subset, best_m, gram.yy - best_explained))
+    return best
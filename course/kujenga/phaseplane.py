@@ -0,0 +1,367 @@
+"""
+Phase planes
+============
+
+In lesson 2 we draw arrows on the phase plane by evaluating ``dXdt`` on a
+6 by 6 ``meshgrid`` and scaling the arrows to unit length. The same approach
+works for much finer grids, since ``dXdt`` is evaluated for the whole grid in
+one go. This module does that for any model, keeps the most recently used
+fields in memory so that redrawing for the same parameters is immediate, and
+computes streamlines: curves that follow the arrows.
+
+It also finds the nullclines, where one of the variables does not change,
+and the equilibria, where the nullclines cross, for any model. In the
+lessons we work these out by hand, e.g. :math:`S=\\gamma/\\beta` for the SIR
+model or :math:`F=a/b` and :math:`R=d/c` for the rabbits and foxes. Here the
+nullclines are traced as the zero contours of each component of the vector
+field, and the equilibria are found from the grid cells where both
+components change sign, then refined with Newton's method and classified by
+the eigenvalues of the Jacobian.
+
+For the SIR model the phase plane shows :math:`S` and :math:`I`, and the
+third variable follows from :math:`R = 1 - S - I`. The ``complete`` argument
+is a function turning the two plotted variables into a full state.
+
+Example
+-------
+
+>>> import matplotlib.pyplot as plt
+>>> from kujenga import models, phaseplane
+>>> fig, ax = plt.subplots()
+>>> phaseplane.draw_streamlines(ax, models.sir_dXdt, (0, 1), (0, 1),
+...                             args=(1/2, 1/7), complete=phaseplane.sir_complete)
+>>> field = phaseplane.vector_field(models.sir_dXdt, (0, 1), (0, 1), n=500,
+...                                 args=(1/2, 1/7), complete=phaseplane.sir_complete)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from . import cache
+
+
+VectorField = namedtuple('VectorField', ['X', 'Y', 'dX', 'dY'])
+Equilibrium = namedtuple('Equilibrium', ['point', 'eigenvalues', 'kind', 'line'],
+                         defaults=(None,))
+Equilibrium.__doc__ = """\
+An equilibrium ``point`` in the plane, the ``eigenvalues`` of the Jacobian
+there and the ``kind`` of equilibrium: ``'stable node'``, ``'unstable
+node'``, ``'saddle'``, ``'stable focus'``, ``'unstable focus'``,
+``'centre'``, ``'degenerate'`` (a zero eigenvalue) or ``'line'``. For a
+line of equilibria, such as :math:`I=0` in the SIR model, ``line`` holds
+the points found along it, in order, and ``point`` is the middle one;
+otherwise ``line`` is ``None``."""
+
+VectorField.__doc__ = """\
+A vector field on a grid: the ``meshgrid`` arrays ``X`` and ``Y`` and the
+rates of change ``dX`` and ``dY`` at each grid point."""
+
+
+def sir_complete(S, I):
+    """The SIR state ``[S, I, R]`` with :math:`R = 1 - S - I`."""
+    return [S, I, 1 - S - I]
+
+
+def _fields_key(dXdt, xlim, ylim, n, args, complete, *extra):
+    return cache.key(dXdt, tuple(xlim), tuple(ylim), tuple(n), tuple(args), complete, *extra)
+
+
+# Recently used fields, looked up by model, parameters and grid
+field_cache = cache.TrajectoryCache(maxsize=32)
+
+
+def vector_field(dXdt, xlim, ylim, n=500, args=(), complete=None, t=0):
+    """
+    Evaluate ``dXdt`` on a grid over the plane.
+
+    Parameters
+    ----------
+    dXdt : callable
+        ``dXdt(X, t, *args)``, where ``X`` is a list of arrays with one
+        entry per state variable, as in the lessons.
+    xlim, ylim : (float, float)
+        The range of the two plotted variables.
+    n : int or (int, int)
+        Number of grid points along each axis, or along x and y.
+    args : tuple
+        Parameter values passed to ``dXdt``.
+    complete : callable, optional
+        ``complete(x, y)`` returning the full state for plotted variables
+        ``x`` and ``y``, for models with more than two variables. The plotted
+        variables must be the first two.
+    t : float
+        Time passed to ``dXdt``.
+
+    Returns
+    -------
+    VectorField
+        Arrays of shape ``(n_y, n_x)``. Fields are cached by model,
+        parameters and grid and returned read-only.
+    """
+    n = (n, n) if np.isscalar(n) else tuple(n)
+    key = _fields_key(dXdt, xlim, ylim, n, args, complete, t)
+    field = field_cache.get(key)
+    if field is None:
+        x = np.linspace(xlim[0], xlim[1], n[0])
+        y = np.linspace(ylim[0], ylim[1], n[1])
+        X, Y = np.meshgrid(x, y)
+        state = complete(X, Y) if complete is not None else [X, Y]
+        derivative = dXdt(state, t, *args)
+        field = field_cache.put(key, np.stack([X, Y, derivative[0], derivative[1]]))
+    return VectorField(*field)
+
+
+def unit_vectors(dX, dY):
+    """Scale the vectors ``(dX, dY)`` to length one, leaving zeros as zeros."""
+    M = np.hypot(dX, dY)
+    M = np.where(M > 0, M, 1)
+    return dX/M, dY/M
+
+
+def draw_arrows(ax, dXdt, xlim, ylim, n=6, args=(), complete=None):
+    """Draw unit arrows on an ``n`` by ``n`` grid, like ``drawArrows`` in the lessons."""
+    field = vector_field(dXdt, xlim, ylim, n, args, complete)
+    dX, dY = unit_vectors(field.dX, field.dY)
+    return ax.quiver(field.X, field.Y, dX, dY, pivot='mid')
+
+
+def streamlines(dXdt, starts, length=1, steps=100, args=(), complete=None,
+                normalise=True, t=0):
+    """
+    Follow the vector field from many starting points at once.
+
+    Parameters
+    ----------
+    dXdt, args, complete, t
+        As for :func:`vector_field`.
+    starts : array_like, shape ``(n, 2)``
+        Starting points in the plane.
+    length : float
+        Length of each streamline if ``normalise``, otherwise the time
+        followed.
+    steps : int
+        Number of RK4 steps along each streamline.
+    normalise : bool
+        Follow the unit vectors, so every streamline has the same length and
+        slows down nowhere, rather than the field itself.
+
+    Returns
+    -------
+    ndarray, shape ``(n, steps + 1, 2)``
+        The points along each streamline.
+    """
+    def f(P):
+        state = complete(P[:, 0], P[:, 1]) if complete is not None else [P[:, 0], P[:, 1]]
+        derivative = dXdt(state, t, *args)
+        dX, dY = np.asarray(derivative[0], dtype=float), np.asarray(derivative[1], dtype=float)
+        if normalise:
+            dX, dY = unit_vectors(dX, dY)
+        return np.stack([dX, dY], axis=1)
+
+    P = np.array(starts, dtype=float)
+    h = length/steps
+    out = np.empty((P.shape[0], steps + 1, 2))
+    out[:, 0] = P
+    for k in range(1, steps + 1):
+        k1 = f(P)
+        k2 = f(P + 0.5*h*k1)
+        k3 = f(P + 0.5*h*k2)
+        k4 = f(P + h*k3)
+        P = P + (h/6)*(k1 + 2*k2 + 2*k3 + k4)
+        out[:, k] = P
+    return out
+
+
+def draw_streamlines(ax, dXdt, xlim, ylim, n=12, length=None, steps=50,
+                     args=(), complete=None, color='k', linewidth=0.5, **options):
+    """
+    Draw streamlines through an ``n`` by ``n`` grid of points, each followed
+    forwards and backwards for ``length`` (by default a fifth of the plot
+    width). The streamlines are cached like the fields, and drawn as a
+    single ``LineCollection``, so redrawing is fast. Extra keyword arguments
+    are passed on to ``LineCollection``.
+    """
+    from matplotlib.collections import LineCollection
+
+    if length is None:
+        length = (xlim[1] - xlim[0])/5
+    key = _fields_key(dXdt, xlim, ylim, (n, n), args, complete, 'streamlines', length, steps)
+    lines = field_cache.get(key)
+    if lines is None:
+        x = np.linspace(xlim[0], xlim[1], n + 2)[1:-1]
+        y = np.linspace(ylim[0], ylim[1], n + 2)[1:-1]
+        starts = np.stack([a.ravel() for a in np.meshgrid(x, y)], axis=1)
+        forwards = streamlines(dXdt, starts, length, steps, args, complete)
+        backwards = streamlines(dXdt, starts, -length, steps, args, complete)
+        lines = field_cache.put(key, np.concatenate([backwards[:, :0:-1], forwards], axis=1))
+    collection = LineCollection(lines, colors=color, linewidths=linewidth, **options)
+    ax.add_collection(collection)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    return collection
+
+
+def nullclines(dXdt, xlim, ylim, n=300, args=(), complete=None):
+    """
+    Trace the nullclines of the two plotted variables.
+
+    Parameters are as for :func:`vector_field`.
+
+    Returns
+    -------
+    x_nullclines, y_nullclines : list of ndarray
+        Curves, each an array of shape ``(points, 2)``, along which the
+        rate of change of the first and second plotted variable is zero.
+    """
+    import contourpy
+
+    field = vector_field(dXdt, xlim, ylim, n, args, complete)
+    curves = []
+    for z in (field.dX, field.dY):
+        generator = contourpy.contour_generator(field.X, field.Y, z,
+                                                line_type=contourpy.LineType.Separate)
+        curves.append(list(generator.lines(0)))
+    return curves[0], curves[1]
+
+
+def _planar(dXdt, args, complete, t):
+    # The vector field as a function of an (n, 2) array of points
+    def f(P):
+        state = complete(P[:, 0], P[:, 1]) if complete is not None else [P[:, 0], P[:, 1]]
+        derivative = dXdt(state, t, *args)
+        return np.stack([np.broadcast_to(np.asarray(derivative[i], dtype=float), P.shape[:1])
+                         for i in (0, 1)], axis=1)
+    return f
+
+
+def _jacobian(f, P, h):
+    J = np.empty(P.shape + (2,))
+    for j in (0, 1):
+        step = np.zeros(2)
+        step[j] = h[j]
+        J[:, :, j] = (f(P + step) - f(P - step))/(2*h[j])
+    return J
+
+
+def classify(eigenvalues, tol=1e-8):
+    """The kind of equilibrium with the two Jacobian ``eigenvalues``."""
+    re, im = eigenvalues.real, eigenvalues.imag
+    scale = max(1, np.max(np.abs(eigenvalues)))
+    if np.any(np.abs(eigenvalues) <= tol*scale):
+        return 'degenerate'
+    if np.any(np.abs(im) > tol*scale):
+        if np.all(np.abs(re) <= tol*scale):
+            return 'centre'
+        return 'stable focus' if re[0] < 0 else 'unstable focus'
+    if re[0]*re[1] < 0:
+        return 'saddle'
+    return 'stable node' if re[0] < 0 else 'unstable node'
+
+
+def equilibria(dXdt, xlim, ylim, n=300, args=(), complete=None, t=0,
+               iterations=50, tol=1e-10):
+    """
+    Find and classify the equilibria in a region of the phase plane.
+
+    Candidates are the grid cells in which both components of the vector
+    field change sign. Each is refined by Newton's method, all at once, with
+    the Jacobian estimated by central differences, and classified by the
+    Jacobian's eigenvalues.
+
+    Parameters are as for :func:`vector_field`, with ``iterations`` and
+    ``tol`` controlling the Newton refinement. The refined points are
+    snapped to grid cells, and points in neighbouring cells that are closer
+    together than a cell are reported once. Degenerate points in
+    neighbouring cells are joined up, so that a line of equilibria (as
+    :math:`I=0` in the SIR model) is reported as one equilibrium of kind
+    ``'line'``.
+
+    Returns
+    -------
+    list of Equilibrium
+    """
+    field = vector_field(dXdt, xlim, ylim, n, args, complete, t)
+
+    def changes_sign(z):
+        corners = np.stack([z[:-1, :-1], z[1:, :-1], z[:-1, 1:], z[1:, 1:]])
+        return (corners.min(axis=0) <= 0) & (corners.max(axis=0) >= 0)
+
+    rows, cols = np.nonzero(changes_sign(field.dX) & changes_sign(field.dY))
+    if rows.size == 0:
+        return []
+    P = np.stack([(field.X[rows, cols] + field.X[rows, cols + 1])/2,
+                  (field.Y[rows, cols] + field.Y[rows + 1, cols])/2], axis=1)
+    cell = np.array([field.X[0, 1] - field.X[0, 0], field.Y[1, 0] - field.Y[0, 0]])
+    h = 1e-6*cell
+    f = _planar(dXdt, args, complete, t)
+
+    for _ in range(iterations):
+        G = f(P)
+        J = _jacobian(f, P, h)
+        # The pseudo-inverse also copes with singular Jacobians on lines of
+        # equilibria, where it moves straight onto the line.
+        step = np.einsum('nij,nj->ni', np.linalg.pinv(J), G)
+        P = P - step
+        if np.all(np.abs(step) <= tol*np.maximum(1, np.abs(P))):
+            break
+
+    G = f(P)
+    scale = np.max(np.abs(np.stack([field.dX, field.dY])))
+    inside = ((P[:, 0] >= xlim[0] - cell[0]) & (P[:, 0] <= xlim[1] + cell[0]) &
+              (P[:, 1] >= ylim[0] - cell[1]) & (P[:, 1] <= ylim[1] + cell[1]))
+    converged = np.all(np.isfinite(P), axis=1) & inside & \
+        (np.max(np.abs(G), axis=1) <= 1e-8*max(scale, 1))
+    P = P[converged]
+    if P.size == 0:
+        return []
+
+    # One point per grid cell, in order of the points
+    cells = np.floor((P - [xlim[0], ylim[0]])/cell).astype(np.int64)
+    cells, first = np.unique(cells, axis=0, return_index=True)
+    found = P[first]
+    eigenvalues = np.linalg.eigvals(_jacobian(f, found, h))
+    eigenvalues = eigenvalues[np.arange(len(found))[:, None],
+                              np.argsort(eigenvalues.real, axis=1)]
+    kinds = [classify(ev) for ev in eigenvalues]
+    degenerate = np.array([kind == 'degenerate' for kind in kinds])
+
+    # Join up points in neighbouring cells that are the same equilibrium, or
+    # both on a line of equilibria
+    width = cells[:, 1].max() - cells[:, 1].min() + 3
+    codes = (cells[:, 0] - cells[:, 0].min() + 1)*width + cells[:, 1] - cells[:, 1].min() + 1
+    order = np.argsort(codes)
+    first, second = [], []
+    for offset in (1, width - 1, width, width + 1):
+        at = np.searchsorted(codes[order], codes + offset)
+        at = np.minimum(at, len(codes) - 1)
+        neighbour = order[at]
+        near = codes[neighbour] == codes + offset
+        a, b = np.nonzero(near)[0], neighbour[near]
+        same = (degenerate[a] & degenerate[b]) | \
+            np.all(np.abs(found[a] - found[b]) < cell, axis=1)
+        first.append(a[same])
+        second.append(b[same])
+    graph = sparse.coo_matrix((np.ones(sum(map(len, first))),
+                               (np.concatenate(first), np.concatenate(second))),
+                              shape=(len(found), len(found)))
+    count, labels = csgraph.connected_components(graph, directed=False)
+
+    result = []
+    for label in range(count):
+        members = np.nonzero(labels == label)[0]
+        if members.size > 1 and degenerate[members].all():
+            # In order along the line's longest direction
+            centred = found[members] - found[members].mean(axis=0)
+            direction = np.linalg.svd(centred, full_matrices=False)[2][0]
+            members = members[np.argsort(centred @ direction)]
+            middle = members[members.size//2]
+            result.append(Equilibrium(found[middle], eigenvalues[middle], 'line',
+                                      found[members]))
+        else:
+            i = members[0]
+            result.append(Equilibrium(found[i], eigenvalues[i], kinds[i]))
+    result.sort(key=lambda equilibrium: tuple(equilibrium.point))
+    return result
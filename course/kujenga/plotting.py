@@ -0,0 +1,124 @@
+"""
+Plotting long time series
+=========================
+
+``plotEpidemicOverTime`` in the lessons passes every time point to
+``ax.plot``. A line on a figure a few hundred pixels wide cannot show more
+than a few thousand points anyway, but matplotlib still has to draw all of
+them, which for millions of points takes a long time.
+
+Here each series is reduced before plotting. *Min/max* decimation splits the
+series into bins and keeps the smallest and largest value in each bin, in
+time order, so peaks and troughs are never lost and the drawn line covers
+exactly the same area as the full one. *Largest triangle three buckets*
+(LTTB) keeps one point per bin, the one that best preserves the shape of the
+curve, which looks smoother for curves without fine detail.
+
+Example
+-------
+
+>>> import matplotlib.pyplot as plt
+>>> from kujenga.plotting import plotEpidemicOverTime
+>>> fig, ax = plt.subplots()
+>>> plotEpidemicOverTime(ax, t, S, I, R)         # any length of t
+"""
+
+import numpy as np
+
+
+def minmax_decimate(t, y, max_points=4000):
+    """
+    Reduce the series ``(t, y)`` to at most ``max_points`` points, keeping
+    the first and last point and the smallest and largest value in each of
+    ``(max_points - 2)//2`` equal bins, in time order.
+    """
+    t = np.asarray(t)
+    y = np.asarray(y)
+    n = y.size
+    if n <= max_points:
+        return t, y
+    bins = max(1, (max_points - 2)//2)
+    size = -(-n//bins)
+    # Pad with the last value so the series splits into equal bins; the
+    # padding can only repeat a value, never add a new minimum or maximum.
+    padded = np.concatenate([y, np.full(bins*size - n, y[-1])]).reshape(bins, size)
+    offsets = np.arange(bins)*size
+    lowest = offsets + np.argmin(padded, axis=1)
+    highest = offsets + np.argmax(padded, axis=1)
+    keep = np.concatenate([[0], np.minimum(lowest, n - 1),
+                           np.minimum(highest, n - 1), [n - 1]])
+    keep = np.unique(keep)
+    return t[keep], y[keep]
+
+
+def lttb(t, y, max_points=4000):
+    """
+    Reduce the series ``(t, y)`` to ``max_points`` points with the largest
+    triangle three buckets algorithm.
+
+    The first and last points are kept and the rest of the series is split
+    into ``max_points - 2`` buckets. From each bucket, the point kept is the
+    one making the largest triangle with the point kept from the previous
+    bucket and the average of the next bucket.
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if n <= max_points or max_points < 3:
+        return t, y
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    # The averages of each bucket, used as the third corner of the triangle
+    counts = np.diff(edges)
+    t_mean = np.add.reduceat(t[:edges[-1]], edges[:-1])/counts
+    y_mean = np.add.reduceat(y[:edges[-1]], edges[:-1])/counts
+    t_mean = np.append(t_mean, t[-1])
+    y_mean = np.append(y_mean, y[-1])
+    keep = np.empty(max_points, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for k in range(max_points - 2):
+        start, stop = edges[k], edges[k + 1]
+        tb, yb = t[start:stop], y[start:stop]
+        area = np.abs((t[a] - t_mean[k + 1])*(yb - y[a]) - (t[a] - tb)*(y_mean[k + 1] - y[a]))
+        a = start + np.argmax(area)
+        keep[k + 1] = a
+    return t[keep], y[keep]
+
+
+def plot_decimated(ax, t, y, *args, max_points=4000, method='minmax', **kwargs):
+    """
+    ``ax.plot(t, y, *args, **kwargs)`` with the series first reduced to at
+    most ``max_points`` points by ``method``, ``'minmax'`` or ``'lttb'``.
+    """
+    if method == 'minmax':
+        t, y = minmax_decimate(t, y, max_points)
+    elif method == 'lttb':
+        t, y = lttb(t, y, max_points)
+    else:
+        raise ValueError("method must be 'minmax' or 'lttb', not %r" % method)
+    return ax.plot(t, y, *args, **kwargs)
+
+
+def plotEpidemicOverTime(ax, t, S, I, R, E=None, max_points=4000, method='minmax'):
+    """
+    The epidemic curves from lesson 2, for series of any length. ``E`` adds
+    the exposed curve of the SEIR model.
+    """
+    plot_decimated(ax, t, S, '--', color='k', label='Suceptible (S)',
+                   max_points=max_points, method=method)
+    if E is not None:
+        plot_decimated(ax, t, E, '-', color='r', label='Exposed (E)',
+                       max_points=max_points, method=method)
+    plot_decimated(ax, t, I, '-', color='k', label='Infectives (I)',
+                   max_points=max_points, method=method)
+    plot_decimated(ax, t, R, ':', color='k' if E is None else 'b', label='Recovered (R)',
+                   max_points=max_points, method=method)
+    ax.legend(loc='best')
+    ax.set_xlabel('Time: t')
+    ax.set_ylabel('Population')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.set_yticks(np.arange(0, 1.01, step=0.5))
+    ax.set_xlim(t[0], t[-1])
+    ax.set_ylim(0, 1)
@@ -0,0 +1,381 @@
+"""
+Fitting lines
+=============
+
+In lesson 1 the best fitting line through the happiness data is found by
+adding columns to the data frame: the squared life expectancy, happiness
+times life expectancy, the predictions and the squared distances. Each
+``df.assign`` copies the whole frame, which is fine for 150 countries but
+not for tens of millions of rows.
+
+All the line needs are a few sums. With :math:`\\bar{x}` and
+:math:`\\bar{y}` the means, and
+
+.. math::
+
+    S_{xx} = \\sum (x_i - \\bar{x})^2, \\quad
+    S_{xy} = \\sum (x_i - \\bar{x})(y_i - \\bar{y}), \\quad
+    S_{yy} = \\sum (y_i - \\bar{y})^2,
+
+the slope is :math:`m = S_{xy}/S_{xx}`, the intercept is
+:math:`k = \\bar{y} - m\\bar{x}`, the sum of squared distances is
+:math:`S_{yy} - S_{xy}^2/S_{xx}` and
+:math:`R^2 = S_{xy}^2/(S_{xx}S_{yy})`, the same as ``ols`` from statsmodels
+gives. Here the sums are taken straight from the numpy arrays behind the
+columns, a block of rows at a time, and the blocks are combined exactly, so
+the memory used does not grow with the number of rows. Rows where either
+value is missing are left out. :class:`RunningLine` keeps the sums between
+batches of data that arrive over time, and :func:`bootstrap_line` shows
+how much the line could change with a different sample of countries.
+
+Example
+-------
+
+>>> from kujenga.regression import fit_line
+>>> line = fit_line(df['LifeExp'], df['Happiness'])
+>>> line.m, line.k, line.sse, line.r2
+
+:func:`fit_groups` fits a line for every group at once, for example
+happiness against each predictor in every year:
+
+>>> from kujenga.regression import fit_groups
+>>> predictors = ['LifeExp', 'LogGDP', 'SocialSupport', 'Freedom', 'Corruption']
+>>> years, lines = fit_groups(happy['Year'], happy[predictors], happy['Happiness'])
+>>> lines.m.shape                  # (number of years, number of predictors)
+"""
+
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+
+LineFit = namedtuple('LineFit', ['m', 'k', 'sse', 'r2', 'n'])
+LineFit.__doc__ = """\
+The least squares line :math:`y = mx + k`: slope, intercept, sum of squared
+distances, :math:`R^2` and the number of rows used. Each is an array when
+several lines are fitted at once."""
+
+Moments = namedtuple('Moments', ['n', 'mx', 'my', 'Sxx', 'Sxy', 'Syy'])
+Moments.__doc__ = """\
+The number of rows, the means of ``x`` and ``y``, and the centred sums of
+squares and products :math:`\\sum (x - \\bar x)^2`,
+:math:`\\sum (x - \\bar x)(y - \\bar y)` and :math:`\\sum (y - \\bar y)^2`,
+from which the least squares line follows. Each is an array when several
+lines are fitted at once."""
+
+
+def _block_moments(x, y):
+    """Moments of the columns of ``x`` and ``y``, both shape ``(rows, p)``,
+    leaving out rows where either is not finite."""
+    keep = np.isfinite(x) & np.isfinite(y)
+    n = keep.sum(axis=0)
+    count = np.maximum(n, 1)
+    mx = np.where(keep, x, 0).sum(axis=0)/count
+    my = np.where(keep, y, 0).sum(axis=0)/count
+    dx = np.where(keep, x - mx, 0)
+    dy = np.where(keep, y - my, 0)
+    return Moments(n, mx, my, np.einsum('ij,ij->j', dx, dx),
+                    np.einsum('ij,ij->j', dx, dy), np.einsum('ij,ij->j', dy, dy))
+
+
+def _merge(a, b):
+    """Moments of the rows of ``a`` and ``b`` together (Chan et al.)."""
+    n = a.n + b.n
+    count = np.maximum(n, 1)
+    dx, dy = b.mx - a.mx, b.my - a.my
+    weight = a.n*b.n/count
+    return Moments(n, a.mx + dx*b.n/count, a.my + dy*b.n/count,
+                    a.Sxx + b.Sxx + weight*dx*dx,
+                    a.Sxy + b.Sxy + weight*dx*dy,
+                    a.Syy + b.Syy + weight*dy*dy)
+
+
+def _line(moments):
+    n, mx, my, Sxx, Sxy, Syy = moments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = Sxy/Sxx
+        sse = np.maximum(Syy - m*Sxy, 0)
+        r2 = m*Sxy/Syy
+    return LineFit(m, my - m*mx, sse, r2, n)
+
+
+def _columns(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    if y.ndim == 1:
+        y = y[:, None]
+    if x.ndim != 2 or y.ndim != 2 or x.shape[0] != y.shape[0]:
+        raise ValueError('x and y must have the same number of rows, got shapes %s and %s'
+                         % (x.shape, y.shape))
+    return x, y
+
+
+class RunningLine:
+    """
+    Least squares line through data that arrives in batches, such as daily
+    survey results.
+
+    Only the count, means and centred sums of squares and products are
+    kept. Each batch is summarised and combined with them exactly, the
+    batch form of Welford's update for a running mean and variance, so the
+    line is always available without going back to earlier data.
+    Accumulators filled from different shards of the data, in different
+    processes for example, can be combined with :meth:`merge`.
+
+    Example
+    -------
+
+    >>> line = RunningLine()
+    >>> for day in days:
+    ...     line.update(day['LifeExp'], day['Happiness'])
+    >>> line.m, line.k, line.sse
+    """
+
+    def __init__(self):
+        self._moments = None
+        self._single = None
+
+    def _add(self, moments, single):
+        if self._moments is None:
+            self._moments, self._single = moments, single
+        elif single != self._single or moments.n.shape != self._moments.n.shape:
+            raise ValueError('expected batches of %d predictor(s), got %d'
+                             % (self._moments.n.size, moments.n.size))
+        else:
+            self._moments = _merge(self._moments, moments)
+
+    def update(self, x, y, block_size=65536):
+        """
+        Add a batch of points; ``x`` and ``y`` are as for :func:`fit_line`
+        and must have the same number of columns in every batch. Returns
+        the accumulator.
+        """
+        single = np.ndim(x) == 1 and np.ndim(y) == 1
+        x, y = _columns(x, y)
+        for start in range(0, x.shape[0], block_size):
+            block = slice(start, start + block_size)
+            self._add(_block_moments(*np.broadcast_arrays(x[block], y[block])), single)
+        return self
+
+    def merge(self, other):
+        """Add everything ``other`` has seen to this accumulator, and return it."""
+        if other._moments is not None:
+            self._add(other._moments, other._single)
+        return self
+
+    def moments(self):
+        """The :class:`Moments` of all the data so far."""
+        if self._moments is None:
+            raise ValueError('no data has been added')
+        if self._single:
+            return Moments(*(value[0].item() for value in self._moments))
+        return self._moments
+
+    def line(self):
+        """The current line, as :func:`fit_line` would give for all the data."""
+        if self._moments is None:
+            raise ValueError('no data has been added')
+        line = _line(self._moments)
+        if self._single:
+            return LineFit(*(value[0].item() for value in line))
+        return line
+
+    @property
+    def m(self):
+        return self.line().m
+
+    @property
+    def k(self):
+        return self.line().k
+
+    @property
+    def sse(self):
+        return self.line().sse
+
+    @property
+    def r2(self):
+        return self.line().r2
+
+    @property
+    def n(self):
+        return self.line().n
+
+    def __repr__(self):
+        if self._moments is None:
+            return 'RunningLine(n=0)'
+        line = self.line()
+        return 'RunningLine(n=%s, m=%s, k=%s)' % (line.n, line.m, line.k)
+
+
+def fit_line(x, y, block_size=65536):
+    """
+    Least squares line through the points ``(x, y)``.
+
+    Parameters
+    ----------
+    x : array_like, shape ``(n,)`` or ``(n, p)``
+        Predictor, or ``p`` predictors to fit a separate line for each.
+        Data frame columns are used without copying.
+    y : array_like, shape ``(n,)`` or ``(n, p)``
+        Response.
+    block_size : int
+        Number of rows summed at a time.
+
+    Returns
+    -------
+    LineFit
+        Scalars for a single predictor, arrays of length ``p`` otherwise.
+    """
+    return RunningLine().update(x, y, block_size).line()
+
+
+def fit_groups(keys, x, y):
+    """
+    Least squares lines for every group of rows, in one pass over the data.
+
+    The rows are sorted by their keys once, and the sums for every group
+    are taken together with ``np.add.reduceat`` over the sorted blocks,
+    first for the means and then for the centred sums, rather than fitting
+    one group at a time.
+
+    Parameters
+    ----------
+    keys : array_like, shape ``(n,)`` or ``(columns, n)``
+        The group of each row, such as ``df['Year']`` or a plain list of
+        years, or several columns whose combinations are the groups, such
+        as ``[df['Year'], df['Region']]``. Anything one dimensional is a
+        single column.
+    x : array_like, shape ``(n,)`` or ``(n, p)``
+        Predictor, or ``p`` predictors to fit a separate line for each.
+    y : array_like, shape ``(n,)`` or ``(n, p)``
+        Response.
+
+    Returns
+    -------
+    groups : ndarray or tuple of ndarray
+        The key of each group, in sorted order, one array per key column.
+    lines : LineFit
+        Arrays of shape ``(groups,)`` for a single predictor, otherwise
+        ``(groups, p)``.
+    """
+    single = np.ndim(x) == 1 and np.ndim(y) == 1
+    x, y = _columns(x, y)
+    columns = [keys] if np.ndim(keys) == 1 else keys
+    columns = [np.asarray(column) for column in columns]
+    if any(column.shape != (x.shape[0],) for column in columns):
+        raise ValueError('expected %d keys in each key column' % x.shape[0])
+
+    # sort by the first key column, then the second, ...; a new group starts
+    # wherever any key changes
+    order = np.lexsort(columns[::-1])
+    columns = [column[order] for column in columns]
+    new_group = np.zeros(x.shape[0], dtype=bool)
+    new_group[:1] = True
+    for column in columns:
+        new_group[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+
+    xs, ys = np.broadcast_arrays(x[order], y[order])
+    keep = np.isfinite(xs) & np.isfinite(ys)
+
+    n = np.add.reduceat(keep, starts, axis=0)
+    count = np.maximum(n, 1)
+    mx = np.add.reduceat(np.where(keep, xs, 0), starts, axis=0)/count
+    my = np.add.reduceat(np.where(keep, ys, 0), starts, axis=0)/count
+    dx = np.where(keep, xs - mx[group], 0)
+    dy = np.where(keep, ys - my[group], 0)
+    lines = _line(Moments(n, mx, my, np.add.reduceat(dx*dx, starts, axis=0),
+                           np.add.reduceat(dx*dy, starts, axis=0),
+                           np.add.reduceat(dy*dy, starts, axis=0)))
+    if single:
+        lines = LineFit(*(value[:, 0] for value in lines))
+
+    groups = tuple(column[starts] for column in columns)
+    return (groups if len(groups) > 1 else groups[0]), lines
+
+
+BootstrapResult = namedtuple('BootstrapResult', ['m', 'k', 'm_interval', 'k_interval',
+                                                 'm_samples', 'k_samples'])
+BootstrapResult.__doc__ = """\
+The line fitted to all the data, percentile bootstrap intervals for its
+slope and intercept, and the slopes and intercepts of every resample."""
+
+
+def _bootstrap_chunk(task):
+    x, y, resamples, seed = task
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, x.size, size=(resamples, x.size))
+    xs, ys = x[index], y[index]
+    mx, my = xs.mean(axis=1), ys.mean(axis=1)
+    # x and y are already centred on their overall means, so these
+    # uncentred sums lose little precision
+    Sxx = np.einsum('ij,ij->i', xs, xs) - x.size*mx*mx
+    Sxy = np.einsum('ij,ij->i', xs, ys) - x.size*mx*my
+    m = Sxy/Sxx
+    return m, my - m*mx
+
+
+def bootstrap_line(x, y, resamples=10000, confidence=0.95, seed=None,
+                   chunk_size=1000, processes=1):
+    """
+    Bootstrap confidence intervals for the least squares line.
+
+    Each resample draws ``n`` of the ``n`` points at random with
+    replacement and fits the line again. ``chunk_size`` resamples are drawn
+    at once as an integer array of shape ``(chunk_size, n)``, and all their
+    slopes come from sums along its rows. Unlike the standard errors from
+    ``ols`` this does not assume the distances from the line are normally
+    distributed.
+
+    Parameters
+    ----------
+    x, y : array_like, shape ``(n,)``
+        Predictor and response; rows where either is missing are left out.
+    resamples : int
+        Number of bootstrap resamples.
+    confidence : float
+        Coverage of the intervals, which run from the ``(1 - confidence)/2``
+        to the ``(1 + confidence)/2`` quantile of the resampled values.
+    seed : int or None
+        Seed for the random numbers. Chunk ``i`` uses the ``i``-th stream
+        spawned from it, so for a given ``seed`` and ``chunk_size`` the
+        results do not depend on ``processes``.
+    chunk_size : int
+        Resamples drawn and fitted together.
+    processes : int or None
+        Number of worker processes. ``None`` uses every core.
+
+    Returns
+    -------
+    BootstrapResult
+    """
+    x, y = _columns(x, y)
+    if x.shape[1] != 1 or y.shape[1] != 1:
+        raise ValueError('bootstrap_line fits a single predictor')
+    keep = np.isfinite(x[:, 0]) & np.isfinite(y[:, 0])
+    x, y = x[keep, 0], y[keep, 0]
+    x_mean, y_mean = x.mean(), y.mean()
+    x, y = x - x_mean, y - y_mean
+
+    sizes = [chunk_size]*(resamples//chunk_size)
+    if resamples % chunk_size:
+        sizes.append(resamples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(x, y, size, s) for size, s in zip(sizes, seeds)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(tasks) == 1:
+        chunks = [_bootstrap_chunk(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+            chunks = pool.map(_bootstrap_chunk, tasks)
+    m = np.concatenate([chunk[0] for chunk in chunks])
+    k = np.concatenate([chunk[1] for chunk in chunks]) + y_mean - m*x_mean
+
+    line = fit_line(x + x_mean, y + y_mean)
+    q = [(1 - confidence)/2, (1 + confidence)/2]
+    return BootstrapResult(line.m, line.k, np.quantile(m, q), np.quantile(k, q), m, k)
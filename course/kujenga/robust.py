@@ -0,0 +1,287 @@
+"""
+Robust lines
+============
+
+In lesson 1 ``plotData`` labels countries such as Yemen and Benin that lie
+far from the others. Squaring the distances makes points far from the line
+count for a lot, so a few such countries can tilt the least squares line.
+Two ways of fitting a line that care much less about them are
+
+* the *Theil-Sen* line, whose slope is the median of the slopes between
+  every pair of points and whose intercept is the median of
+  :math:`y - mx`, and
+* the *Huber* line, which squares small distances but counts large ones
+  only in proportion to their size. It is found by iteratively reweighted
+  least squares: fit, give points far from the line less weight, and fit
+  again.
+
+With :math:`n` points there are :math:`n(n-1)/2` pairs, too many to list
+for a large data set. :func:`theil_sen` instead counts how many pairs have
+a slope in a given range, which is the number of pairs of points whose
+order changes between sorting them by :math:`y - \\theta_1 x` and by
+:math:`y - \\theta_2 x`. These are counted (with a merge sort) in
+:math:`O(n \\log n)`, so random pairs from the range can be drawn to narrow
+it down, until few enough pairs are left to list them all. Data recorded as
+whole numbers have many pairs with exactly the same slope; these are kept
+together, and if the median is one of them it is found without listing
+them.
+
+Both return a :class:`kujenga.regression.LineFit`, with the sum of squared
+distances and :math:`R^2` of the robust line, for comparison with
+:func:`kujenga.regression.fit_line`.
+
+Example
+-------
+
+>>> from kujenga import regression, robust
+>>> regression.fit_line(df['LifeExp'], df['Happiness']).m
+>>> robust.theil_sen(df['LifeExp'], df['Happiness']).m
+>>> robust.huber(df['LifeExp'], df['Happiness']).m
+"""
+
+import numpy as np
+
+from . import regression
+
+
+def _points(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.ndim != 1 or x.shape != y.shape:
+        raise ValueError('x and y must be one dimensional and the same length, got shapes '
+                         '%s and %s' % (x.shape, y.shape))
+    keep = np.isfinite(x) & np.isfinite(y)
+    return x[keep], y[keep]
+
+
+def _result(x, y, m, k):
+    residuals = y - m*x - k
+    sse = residuals @ residuals
+    total = np.sum((y - y.mean())**2)
+    return regression.LineFit(float(m), float(k), float(sse), float(1 - sse/total), x.size)
+
+
+##############################################################################
+# Theil-Sen
+
+def _order(x, y, cut):
+    """
+    The points sorted by :math:`y - \\theta x` for the ``cut = (theta,
+    inclusive)``. A pair with slope exactly ``theta`` is put in decreasing
+    order of x if ``inclusive``, so that it counts as below the cut, and in
+    increasing order of x otherwise, so that it counts as above. This relies
+    on the points already being in decreasing order of x. ``theta`` may be
+    infinite.
+    """
+    theta, inclusive = cut
+    if theta == -np.inf:
+        return np.lexsort((y, x))
+    if theta == np.inf:
+        return np.lexsort((y, -x))
+    key = y - theta*x
+    if inclusive:
+        return np.argsort(key, kind='stable')
+    return np.lexsort((x, key))
+
+
+def _merge_levels(r):
+    """
+    Bottom up merge sort of the permutation ``r``. At each level, yields
+    the values in the left halves of the blocks being merged (sorted within
+    each block), the values in the right halves, and for each right value
+    the slice ``start:stop`` of the left values in its block that are
+    larger, so that each (left, right) value in those slices is an
+    inversion of ``r``.
+    """
+    n = r.size
+    index = np.arange(n)
+    a = r
+    width = 1
+    while width < n:
+        block = index//(2*width)
+        right = index % (2*width) >= width
+        key = block*n + a
+        # Each block is two sorted runs, which a stable sort merges in linear time
+        order = np.argsort(key, kind='stable')
+        position = np.empty(n, dtype=np.intp)
+        position[order] = index
+        block_right = block[right]
+        # left values smaller than a right value: how far it moves towards
+        # the start of its block when the two halves are merged
+        smaller = position[right] - (index[right] - width)
+        start = width*block_right + smaller
+        stop = width*block_right + np.minimum(width, n - 2*width*block_right)
+        yield a[~right], a[right], start, stop
+        a = key[order] - block*n
+        width *= 2
+
+
+def _bracket(x, y, lower, upper):
+    order_lower = _order(x, y, lower)
+    order_upper = _order(x, y, upper)
+    rank_upper = np.empty(x.size, dtype=np.intp)
+    rank_upper[order_upper] = np.arange(x.size)
+    return rank_upper[order_lower], order_upper
+
+
+def _count(x, y, lower, upper):
+    """Number of pairs of points with slope between the cuts ``lower`` and
+    ``upper``."""
+    if not lower < upper:
+        return 0
+    r, _ = _bracket(x, y, lower, upper)
+    return sum(int(np.sum(stop - start)) for _, _, start, stop in _merge_levels(r))
+
+
+def _slopes(x, y, lower, upper, numbers):
+    """Slopes of the pairs between the cuts ``lower`` and ``upper``
+    numbered ``numbers`` (sorted) in the order they are found by
+    :func:`_merge_levels`."""
+    r, order_upper = _bracket(x, y, lower, upper)
+    first, second = [], []
+    offset = 0
+    for left, right, start, stop in _merge_levels(r):
+        counts = stop - start
+        ends = offset + np.cumsum(counts)
+        here = numbers[np.searchsorted(numbers, offset):np.searchsorted(numbers, ends[-1])]
+        j = np.searchsorted(ends, here, side='right')
+        first.append(left[start[j] + here - (ends[j] - counts[j])])
+        second.append(right[j])
+        offset = ends[-1]
+    i = order_upper[np.concatenate(first)]
+    j = order_upper[np.concatenate(second)]
+    return (y[i] - y[j])/(x[i] - x[j])
+
+
+def _select(x, y, ranks, rng, sample_size, list_size, lower=(-np.inf, True),
+            upper=(np.inf, True), below=0, inside=None):
+    """
+    The slopes between pairs of points of the given ``ranks``, counting
+    from 1, which should be close together.
+
+    The search keeps the slopes wanted between two cuts ``(theta,
+    inclusive)``, which lie just above ``theta`` if ``inclusive`` and just
+    below it otherwise, so that a block of pairs with the same slope is
+    never split: the pairs with slope exactly ``theta`` are those between
+    ``(theta, False)`` and ``(theta, True)``.
+    """
+    if inside is None:
+        inside = _count(x, y, lower, upper)
+    first, last = min(ranks), max(ranks)
+    # each round narrows the range to about 6/sqrt(sample_size) of the pairs
+    while inside > max(list_size, sample_size):
+        sample = np.sort(_slopes(x, y, lower, upper,
+                                 np.sort(rng.integers(0, inside, sample_size))))
+        # a range around the slopes wanted, wide enough to contain them
+        # unless the sample is unusually unlucky
+        spread = 3*np.sqrt(sample_size)
+        low = int((first - below)/inside*sample_size - spread)
+        high = int(np.ceil((last - below)/inside*sample_size + spread))
+        thetas = sorted({sample[i] for i in (low, high) if 0 <= i < sample_size})
+        # a slope repeated in the sample gets cuts on both sides, to keep its
+        # pairs together
+        repeated = np.searchsorted(sample, thetas, 'right') - np.searchsorted(sample, thetas) > 1
+        cuts = [cut for theta, tied in zip(thetas, repeated)
+                for cut in ([(theta, False)] if tied else []) + [(theta, True)]]
+        cuts = [lower] + [cut for cut in cuts if lower < cut < upper] + [upper]
+        counts = [_count(x, y, a, b) for a, b in zip(cuts[:-2], cuts[1:-1])]
+        counts.append(inside - sum(counts))
+        if counts[-1] < 0:                      # rounding near the cuts
+            break
+        ends = np.cumsum(counts)
+        pieces = np.searchsorted(ends, [rank - below for rank in ranks])
+        if pieces[0] != pieces[-1]:
+            # the ranks are in different ranges; narrow each on its own
+            return np.concatenate([
+                _select(x, y, [rank], rng, sample_size, list_size, cuts[k], cuts[k + 1],
+                        below + int(ends[k]) - counts[k], counts[k])
+                for rank, k in zip(ranks, pieces)])
+        k = pieces[0]
+        if cuts[k][0] == cuts[k + 1][0]:        # all the pairs left have this slope
+            return np.full(len(ranks), cuts[k][0])
+        if counts[k] >= inside:                 # no progress, so list them
+            break
+        lower, upper = cuts[k], cuts[k + 1]
+        below, inside = below + int(ends[k]) - counts[k], counts[k]
+    slopes = _slopes(x, y, lower, upper, np.arange(inside))
+    wanted = np.clip(np.asarray(ranks) - below - 1, 0, slopes.size - 1)
+    return np.partition(slopes, wanted)[wanted]
+
+
+def theil_sen(x, y, seed=None, sample_size=None, list_size=None):
+    """
+    The Theil-Sen line: the median slope between pairs of points with
+    different ``x``, and the median of ``y - m*x``.
+
+    Parameters
+    ----------
+    x, y : array_like, shape ``(n,)``
+        Rows where either is missing are left out.
+    seed : int or None
+        Seed for drawing pairs. The result does not depend on it, only the
+        time taken.
+    sample_size : int, optional
+        Pairs drawn to narrow the range of slopes, by default ``n``, and
+        at least 1000.
+    list_size : int, optional
+        Pairs few enough to list, by default ``4n`` or a million,
+        whichever is larger.
+
+    Returns
+    -------
+    LineFit
+    """
+    x, y = _points(x, y)
+    # with the points in decreasing order of x, a stable sort by y - theta*x
+    # breaks ties as _order needs
+    order = np.argsort(-x, kind='stable')
+    x, y = x[order], y[order]
+    n = x.size
+    rng = np.random.default_rng(seed)
+    sample_size = max(n, 1000) if sample_size is None else max(sample_size, 1000)
+    list_size = max(4*n, 2**20) if list_size is None else list_size
+    pairs = _count(x, y, (-np.inf, True), (np.inf, True))
+    if pairs == 0:
+        raise ValueError('at least two points with different x are needed')
+    m = np.mean(_select(x, y, [(pairs + 1)//2, pairs//2 + 1], rng, sample_size, list_size,
+                        inside=pairs))
+    return _result(x, y, m, np.median(y - m*x))
+
+
+##############################################################################
+# Huber
+
+def huber(x, y, c=1.345, tol=1e-10, max_iterations=100):
+    """
+    The Huber line by iteratively reweighted least squares.
+
+    Starting from the least squares line, each point is weighted by
+    :math:`\\min(1, c\\sigma/|r|)`, where :math:`r` is its distance from the
+    line and :math:`\\sigma` is estimated from the median absolute distance,
+    and the weighted least squares line is found. This repeats until the
+    slope and intercept change by less than ``tol``. The default ``c`` loses
+    only 5% of the precision of least squares when there are no outliers.
+
+    Returns
+    -------
+    LineFit
+    """
+    x, y = _points(x, y)
+    line = regression.fit_line(x, y)
+    m, k = line.m, line.k
+    for _ in range(max_iterations):
+        r = y - m*x - k
+        sigma = np.median(np.abs(r - np.median(r)))/0.6745
+        if sigma == 0:
+            break
+        w = np.minimum(1, c*sigma/np.maximum(np.abs(r), np.finfo(float).tiny))
+        total = w.sum()
+        mx, my = (w @ x)/total, (w @ y)/total
+        dx = x - mx
+        m_new = (w*dx) @ (y - my)/((w*dx) @ dx)
+        k_new = my - m_new*mx
+        converged = abs(m_new - m) <= tol*(1 + abs(m)) and abs(k_new - k) <= tol*(1 + abs(k))
+        m, k = m_new, k_new
+        if converged:
+            break
+    return _result(x, y, m, k)
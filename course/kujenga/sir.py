@@ -0,0 +1,126 @@
+"""
+SIR without simulation
+======================
+
+In lesson 2 we find out when the epidemic peaks and how many people get
+infected by simulating the SIR model and reading the answers off the curve.
+For the SIR model we do not need to simulate. Dividing :math:`dI/dt` by
+:math:`dS/dt` and integrating shows that
+
+.. math::
+
+    S + I - \\rho \\ln S, \\qquad \\rho = \\gamma/\\beta
+
+stays constant along every trajectory. From this:
+
+* the peak is where the I-nullcline :math:`S=\\rho` is crossed, so the peak
+  height follows directly from the initial state;
+* the final number susceptible :math:`S_\\infty` is the root below
+  :math:`\\rho` of :math:`S - \\rho\\ln S = S_0 + I_0 - \\rho\\ln S_0`;
+* the time of the peak is the integral of :math:`dt = -dS/(\\beta S I(S))`
+  from :math:`S_0` to :math:`\\rho`, a one dimensional quadrature.
+
+All of these are computed for whole arrays of parameters at once.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga.sir import sir_summary
+>>> summary = sir_summary(1/2, 1/7, [0.9999, 0.0001, 0.0])
+>>> summary.peak_time, summary.peak_I, summary.final_R
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+
+SIRSummary = namedtuple('SIRSummary', ['peak_time', 'peak_I', 'final_R'])
+SIRSummary.__doc__ = """\
+Peak time, peak proportion infected and final proportion recovered of an
+SIR epidemic, each an array with the broadcast shape of the inputs."""
+
+# Gauss-Legendre nodes and weights on [0, 1] for the peak time integral
+_nodes, _weights = np.polynomial.legendre.leggauss(64)
+_nodes = (_nodes + 1)/2
+_weights = _weights/2
+
+
+def _I_of_S(S, S0, I0, rho):
+    # Proportion infected when the proportion susceptible is S
+    return S0 + I0 - S + rho*np.log(S/S0)
+
+
+def final_susceptible(S0, I0, rho, iterations=100, tol=1e-14):
+    """
+    Solve :math:`S - \\rho\\ln S = S_0 + I_0 - \\rho\\ln S_0` for the root
+    :math:`S_\\infty < \\min(S_0, \\rho)`.
+
+    Newton's method is applied to :math:`u = \\ln S`, where the equation is
+    convex and decreasing. Starting to the left of the root, every iterate
+    stays to the left of it and the iteration converges monotonically.
+    """
+    S0, I0, rho = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                        for a in (S0, I0, rho)))
+    C = S0 + I0 - rho*np.log(S0)
+    u = -C/rho                          # g(u) = exp(u) - rho*u - C > 0 here
+    for _ in range(iterations):
+        step = (np.exp(u) - rho*u - C)/(np.exp(u) - rho)
+        u = u - step
+        if np.all(np.abs(step) <= tol*np.maximum(1, np.abs(u))):
+            break
+    S_inf = np.exp(u)
+    # With no-one infected nothing happens
+    return np.where(I0 > 0, np.minimum(S_inf, S0), S0)
+
+
+def sir_summary(beta, gamma, X0):
+    """
+    Peak time, peak height and final size of the SIR epidemic
+    ``models.sir_dXdt`` without simulating it.
+
+    Parameters
+    ----------
+    beta, gamma : array_like
+        Transmission and recovery rates. Arrays are broadcast together.
+    X0 : array_like
+        Initial proportions ``[S, I, R]``, shape ``(3,)`` or ``(..., 3)``.
+
+    Returns
+    -------
+    SIRSummary
+        ``peak_time``, ``peak_I`` and ``final_R``. If :math:`S_0 \\le
+        \\gamma/\\beta` the number infected only falls, and the peak is at
+        time zero.
+    """
+    beta = np.asarray(beta, dtype=float)
+    gamma = np.asarray(gamma, dtype=float)
+    X0 = np.asarray(X0, dtype=float)
+    S0, I0, R0 = np.moveaxis(X0, -1, 0)
+    beta, gamma, S0, I0, R0 = np.broadcast_arrays(beta, gamma, S0, I0, R0)
+    rho = gamma/beta
+
+    grows = (S0 > rho) & (I0 > 0)
+    S_peak = np.where(grows, rho, S0)
+    peak_I = np.where(grows, _I_of_S(S_peak, S0, I0, rho), I0)
+
+    S_inf = final_susceptible(S0, I0, rho)
+    final_R = S0 + I0 + R0 - S_inf
+
+    # The time to go from S0 to rho. Writing x = S0 - S, the integrand
+    # 1/(beta*S*I) has a sharp spike near x=0 when I0 is small, because I
+    # starts out growing like I0 + c*x with c = 1 - rho/S0. The substitution
+    # x = (I0/c)*(exp(w) - 1) turns the spike into a smooth function of w.
+    c = np.where(grows, 1 - rho/S0, 1)
+    I0_safe = np.where(grows, I0, 1)
+    w_end = np.where(grows, np.log1p(c*(S0 - S_peak)/I0_safe), 0)
+    w = w_end[..., None]*_nodes
+    x = (I0_safe/c)[..., None]*np.expm1(w)
+    dx_dw = (I0_safe/c)[..., None]*np.exp(w)
+    S = np.clip(S0[..., None] - x, rho[..., None], None)
+    I = _I_of_S(S, S0[..., None], I0_safe[..., None], rho[..., None])
+    integrand = dx_dw/(beta[..., None]*S*I)
+    peak_time = np.where(grows, w_end*np.sum(_weights*integrand, axis=-1), 0)
+
+    return SIRSummary(peak_time, peak_I, final_R)
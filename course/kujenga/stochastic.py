@@ -0,0 +1,201 @@
+"""
+Stochastic SIR
+==============
+
+The SIR model in lesson 2 follows population proportions and is
+deterministic: start with 0.01% infected and there will always be an
+epidemic if :math:`\\beta > \\gamma`. In a real outbreak the first few
+infectives may well recover before passing the disease on, and the outbreak
+dies out by chance. To see this we follow whole numbers of people instead.
+
+With :math:`N = S + I + R` people, each infection happens at rate
+:math:`\\beta S I / N` and each recovery at rate :math:`\\gamma I`, so for
+large :math:`N` the proportions follow the same equations as ``dXdt`` in the
+lesson. Two methods are provided:
+
+* the Gillespie algorithm, which simulates every single infection and
+  recovery exactly, for small populations;
+* binomial tau-leaping, which moves forward in small time steps of length
+  :math:`\\tau` and draws how many people were infected and recovered during
+  each one, for large populations.
+
+Both simulate many replicates at once as arrays. Replicates are split into
+chunks, each with its own random number stream derived from ``seed``, and the
+chunks can be run on several processes.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga.stochastic import simulate
+>>> t = np.linspace(0, 100, 1000)
+>>> X = simulate(1/2, 1/7, [999990, 10, 0], t, replicates=1000, seed=1)
+>>> S, I, R = X[0].T                  # the first replicate
+>>> extinct = X[:, -1, 2] < 100       # outbreaks that died out early
+"""
+
+import multiprocessing
+
+import numpy as np
+
+
+def gillespie(beta, gamma, X0, t, replicates, rng):
+    """
+    Exact stochastic simulation of the SIR model.
+
+    All replicates take one event (an infection or a recovery) per pass of
+    the loop, so the number of passes is the largest number of events in any
+    replicate, at most :math:`2S_0 + I_0`.
+
+    Parameters
+    ----------
+    beta, gamma : float
+        Transmission and recovery rates, as in the deterministic model.
+    X0 : array_like of int
+        Initial numbers ``[S, I, R]``.
+    t : array_like
+        Increasing output times, starting at the initial time.
+    replicates : int
+        Number of independent simulations.
+    rng : numpy.random.Generator
+        Source of random numbers.
+
+    Returns
+    -------
+    X : ndarray of int, shape ``(replicates, len(t), 3)``
+    """
+    t = np.asarray(t, dtype=float)
+    X = np.tile(np.asarray(X0, dtype=np.int64), (replicates, 1))
+    N = X.sum(axis=1)
+    out = np.empty((replicates, t.size, 3), dtype=np.int64)
+    now = np.full(replicates, t[0])
+    k = np.zeros(replicates, dtype=np.int64)     # next output time to fill
+    rows = np.arange(replicates)
+    while True:
+        S, I = X[:, 0], X[:, 1]
+        infection = beta*S*I/N
+        total = infection + gamma*I
+        with np.errstate(divide='ignore'):
+            wait = np.where(total > 0, rng.exponential(1, replicates)/total, np.inf)
+        after = now + wait
+        # The state holds until the next event, so fill in every output time
+        # before it. Usually this is at most one time per replicate.
+        while True:
+            fill = k < t.size
+            fill[fill] = t[k[fill]] < after[fill]
+            if not fill.any():
+                break
+            out[rows[fill], k[fill]] = X[fill]
+            k[fill] += 1
+        running = k < t.size
+        if not running.any():
+            return out
+        infected = rng.random(replicates)*total < infection
+        step = np.where(infected[:, None], [-1, 1, 0], [0, -1, 1])
+        X[running] += step[running]
+        now = after
+
+
+def tau_leap(beta, gamma, X0, t, replicates, rng, tau=0.1):
+    """
+    Approximate stochastic simulation of the SIR model by binomial
+    tau-leaping.
+
+    In a step of length :math:`\\tau` each susceptible is infected with
+    probability :math:`1 - e^{-\\beta I \\tau / N}` and each infective
+    recovers with probability :math:`1 - e^{-\\gamma\\tau}`, so the numbers
+    never go negative. The parameters and result are as for
+    :func:`gillespie`, with ``tau`` the largest step taken.
+    """
+    t = np.asarray(t, dtype=float)
+    X = np.tile(np.asarray(X0, dtype=np.int64), (replicates, 1))
+    N = X.sum(axis=1)
+    out = np.empty((replicates, t.size, 3), dtype=np.int64)
+    out[:, 0] = X
+    for k in range(1, t.size):
+        n = int(np.ceil((t[k] - t[k-1])/tau - 1e-9))
+        h = (t[k] - t[k-1])/n
+        p_recover = -np.expm1(-gamma*h)
+        for _ in range(n):
+            S, I = X[:, 0], X[:, 1]
+            infections = rng.binomial(S, -np.expm1(-beta*I*h/N))
+            recoveries = rng.binomial(I, p_recover)
+            X[:, 0] -= infections
+            X[:, 1] += infections - recoveries
+            X[:, 2] += recoveries
+        out[:, k] = X
+    return out
+
+
+def _run_chunk(task):
+    method, beta, gamma, X0, t, replicates, seed, options = task
+    rng = np.random.default_rng(seed)
+    if method == 'gillespie':
+        return gillespie(beta, gamma, X0, t, replicates, rng)
+    return tau_leap(beta, gamma, X0, t, replicates, rng, **options)
+
+
+def simulate(beta, gamma, X0, t, replicates=100, method='auto', seed=None,
+             chunk_size=1000, processes=1, tau=None, gillespie_limit=10000):
+    """
+    Simulate replicates of the stochastic SIR model.
+
+    Parameters
+    ----------
+    beta, gamma : float
+        Transmission and recovery rates, as in the deterministic model.
+    X0 : array_like of int
+        Initial numbers ``[S, I, R]``.
+    t : array_like
+        Increasing output times, starting at the initial time.
+    replicates : int
+        Number of independent simulations.
+    method : {'auto', 'gillespie', 'tau_leap'}
+        ``'auto'`` uses the Gillespie algorithm for populations up to
+        ``gillespie_limit`` and tau-leaping above that.
+    seed : int or None
+        Seed for the random numbers. Chunk ``i`` of ``chunk_size``
+        replicates uses the ``i``-th stream spawned from it, so for a given
+        ``seed`` and ``chunk_size`` the results do not depend on
+        ``processes``.
+    chunk_size : int
+        Replicates simulated together as one array.
+    processes : int or None
+        Number of worker processes. ``None`` uses every core.
+    tau : float or None
+        Step of the tau-leaping. By default a tenth of the shortest of the
+        mean infectious period :math:`1/\\gamma` and the time
+        :math:`1/\\beta` between infections by one infective.
+    gillespie_limit : int
+        Largest population simulated exactly by ``'auto'``.
+
+    Returns
+    -------
+    X : ndarray of int, shape ``(replicates, len(t), 3)``
+    """
+    X0 = np.asarray(X0)
+    if not np.issubdtype(X0.dtype, np.integer):
+        if np.any(X0 != np.round(X0)):
+            raise ValueError('X0 must be whole numbers of people, not proportions')
+        X0 = X0.astype(np.int64)
+    if method == 'auto':
+        method = 'gillespie' if X0.sum() <= gillespie_limit else 'tau_leap'
+    if method not in ('gillespie', 'tau_leap'):
+        raise ValueError("method must be 'auto', 'gillespie' or 'tau_leap', not %r" % method)
+    options = {}
+    if method == 'tau_leap':
+        options['tau'] = tau if tau is not None else 0.1/max(beta, gamma)
+    sizes = [chunk_size]*(replicates//chunk_size)
+    if replicates % chunk_size:
+        sizes.append(replicates % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(method, beta, gamma, X0, t, size, s, options)
+             for size, s in zip(sizes, seeds)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(tasks) == 1:
+        chunks = [_run_chunk(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+            chunks = pool.map(_run_chunk, tasks)
+    return np.concatenate(chunks, axis=0)
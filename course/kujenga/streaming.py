@@ -0,0 +1,158 @@
+"""
+Streaming simulations
+=====================
+
+The lessons build the whole time grid ``t = np.linspace(...)`` and the whole
+solution ``X`` before plotting. That is fine for 1000 time points, but a
+simulation with :math:`10^8` points would need gigabytes. Here the solution
+is produced in blocks of a fixed size instead. Each block can be written to
+a ``.npy`` file on disk, which is then read back as a memory map, and
+reduced to the smallest and largest values in each of a few thousand time
+bins, which is all a plot needs. The memory used does not depend on the
+number of time points.
+
+Example
+-------
+
+>>> from kujenga import models, streaming
+>>> t, low, high = streaming.simulate(models.seir_dXdt, [0.999, 0, 0.001, 0],
+...                                   0, 400, 10**8, args=(1/5, 1/7, 1/9),
+...                                   path='seir.npy')
+>>> X = np.load('seir.npy', mmap_mode='r')     # the full solution, on disk
+"""
+
+import numpy as np
+from scipy import integrate
+
+
+def time_block(t0, t1, n, start, stop):
+    """Points ``start`` to ``stop`` of ``np.linspace(t0, t1, n)``."""
+    i = np.arange(start, stop)
+    if n == 1:                       # linspace gives just t0
+        return np.full(i.shape, t0, dtype=float)
+    return np.where(i == n - 1, t1, t0 + i*((t1 - t0)/(n - 1)))
+
+
+def odeint_chunks(dXdt, X0, t0, t1, n, chunk_size=100000, args=(), **options):
+    """
+    Solve ``dXdt`` on ``np.linspace(t0, t1, n)`` one block at a time.
+
+    The solver is restarted from the last state of each block, so only one
+    block of times and states is held in memory at once.
+
+    Parameters
+    ----------
+    dXdt, X0, args, **options
+        As for ``integrate.odeint``.
+    t0, t1, n
+        The time grid, as for ``np.linspace``.
+    chunk_size : int
+        Number of time points per block.
+
+    Yields
+    ------
+    start : int
+        Index of the first time point in the block.
+    t : ndarray, shape ``(m,)``
+    X : ndarray, shape ``(m, len(X0))``
+    """
+    if n < 1:
+        raise ValueError('n must be at least 1')
+    X = np.asarray(X0, dtype=float)
+    t_last = t0
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        t = time_block(t0, t1, n, start, stop)
+        if start == 0:
+            block = integrate.odeint(dXdt, X, t, args=tuple(args), **options)
+        else:
+            block = integrate.odeint(dXdt, X, np.concatenate([[t_last], t]),
+                                     args=tuple(args), **options)[1:]
+        X = block[-1]
+        t_last = t[-1]
+        yield start, t, block
+
+
+class MinMaxDecimator:
+    """
+    Running smallest and largest values of a long series in ``bins`` equal
+    bins of its ``n`` points, fed one block at a time.
+    """
+
+    def __init__(self, n, bins, d):
+        self.n = n
+        self.bins = min(bins, n)
+        self.low = np.full((self.bins, d), np.inf)
+        self.high = np.full((self.bins, d), -np.inf)
+        self.t_low = np.full(self.bins, np.inf)
+        self.t_high = np.full(self.bins, -np.inf)
+
+    def add(self, start, t, X):
+        """Add the block of points ``start`` onwards at times ``t``."""
+        index = (np.arange(start, start + len(t))*self.bins)//self.n
+        edges = np.concatenate([[0], np.nonzero(np.diff(index))[0] + 1])
+        bins = index[edges]
+        # A bin split between two blocks is combined with what is already there
+        self.low[bins] = np.minimum(self.low[bins], np.minimum.reduceat(X, edges, axis=0))
+        self.high[bins] = np.maximum(self.high[bins], np.maximum.reduceat(X, edges, axis=0))
+        self.t_low[bins] = np.minimum(self.t_low[bins], t[edges])
+        self.t_high[bins] = np.maximum(self.t_high[bins], np.maximum.reduceat(t, edges))
+
+    def result(self):
+        """
+        The middle time of each bin and the smallest and largest values in
+        it, arrays of shape ``(bins,)``, ``(bins, d)`` and ``(bins, d)``.
+        """
+        return (self.t_low + self.t_high)/2, self.low, self.high
+
+    def envelope(self):
+        """
+        The bins as one series for plotting, going through the smallest then
+        the largest value in each bin: arrays of shape ``(2*bins,)`` and
+        ``(2*bins, d)``.
+        """
+        t, low, high = self.result()
+        return np.repeat(t, 2), np.stack([low, high], axis=1).reshape(-1, low.shape[1])
+
+
+def simulate(dXdt, X0, t0, t1, n, args=(), chunk_size=100000, path=None,
+             bins=2000, **options):
+    """
+    Solve ``dXdt`` on ``np.linspace(t0, t1, n)`` in blocks, optionally saving
+    the solution to ``path`` as a ``.npy`` file, and return its min/max
+    decimation.
+
+    Parameters
+    ----------
+    dXdt, X0, args, **options
+        As for ``integrate.odeint``.
+    t0, t1, n
+        The time grid, as for ``np.linspace``.
+    chunk_size : int
+        Number of time points per block.
+    path : str, optional
+        File to save the full ``(n, len(X0))`` solution in. Open it with
+        ``np.load(path, mmap_mode='r')`` to use it without reading it all.
+    bins : int
+        Number of bins in the decimation.
+
+    Returns
+    -------
+    t, low, high : ndarray
+        See :meth:`MinMaxDecimator.result`.
+    """
+    d = np.size(X0)
+    decimator = MinMaxDecimator(n, bins, d)
+    out = None
+    if path is not None:
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n, d))
+    try:
+        for start, t, X in odeint_chunks(dXdt, X0, t0, t1, n, chunk_size, args, **options):
+            if out is not None:
+                out[start:start + len(t)] = X
+            decimator.add(start, t, X)
+    finally:
+        if out is not None:
+            out.flush()
+            del out
+    return decimator.result()
@@ -0,0 +1,207 @@
+"""
+Batched parameter sweeps
+========================
+
+The lessons simulate one parameter set at a time with ``integrate.odeint``.
+When we want to look at thousands of values of :math:`\\beta` and
+:math:`\\gamma` it is much faster to stack all of the parameter sets into one
+``(N, 3)`` state array and step them forward together, so that every
+arithmetic operation works on ``N`` numbers at once.
+
+Example
+-------
+
+>>> import numpy as np
+>>> from kujenga import sweep
+>>> beta = np.linspace(0.2, 1, 10000)
+>>> gamma = np.full_like(beta, 1/7)
+>>> t = np.linspace(0, 100, 1000)
+>>> X = sweep.sir_sweep(beta, gamma, [0.9999, 0.0001, 0.0], t)
+>>> S, I, R = X[0].T      # the trajectory for the first parameter set
+"""
+
+import numpy as np
+
+
+def sir_dXdt(X, t, beta, gamma):
+    """
+    Right hand side of the SIR model for a batch of states.
+
+    ``X`` has shape ``(N, 3)``, one row ``[S, I, R]`` per parameter set, and
+    ``beta`` and ``gamma`` are scalars or arrays of length ``N``.
+    """
+    S, I, R = X.T
+    infection = beta*S*I
+    recovery = gamma*I
+    dX = np.empty_like(X)
+    dX[:, 0] = -infection                 # Susceptible X[0] is S
+    dX[:, 1] = infection - recovery       # Infectives X[1] is I
+    dX[:, 2] = recovery                   # Recovered X[2] is R
+    return dX
+
+
+def _prepare(X0, t, args):
+    t = np.asarray(t, dtype=float)
+    if t.ndim != 1 or t.size < 1:
+        raise ValueError('t must be a one dimensional array of output times')
+    if np.any(np.diff(t) <= 0):
+        raise ValueError('t must be strictly increasing')
+    args = tuple(np.asarray(a, dtype=float) for a in args)
+    N = max([a.size for a in args if a.ndim > 0] + [1])
+    X0 = np.asarray(X0, dtype=float)
+    if X0.ndim == 1:
+        X0 = np.tile(X0, (N, 1))
+    elif X0.shape[0] == 1:
+        X0 = np.tile(X0[0], (N, 1))
+    N = X0.shape[0]
+    for a in args:
+        if a.ndim > 0 and a.size != N:
+            raise ValueError('parameter arrays must all have length %d' % N)
+    return X0, t, args
+
+
+def rk4(dXdt, X0, t, args=(), max_step=0.1):
+    """
+    Integrate a batch of ODEs with the classical fixed step Runge-Kutta method.
+
+    Parameters
+    ----------
+    dXdt : callable
+        ``dXdt(X, t, *args)`` returning the derivative of the ``(N, d)``
+        state array ``X``.
+    X0 : array_like
+        Initial state, shape ``(d,)`` (shared) or ``(N, d)``.
+    t : array_like
+        Strictly increasing output times. ``t[0]`` is the initial time.
+    args : tuple
+        Extra arguments passed on to ``dXdt``, scalars or length ``N`` arrays.
+    max_step : float
+        Largest step taken. Each interval between output times is split into
+        the smallest number of equal steps no longer than this.
+
+    Returns
+    -------
+    X : ndarray, shape ``(N, len(t), d)``
+    """
+    X0, t, args = _prepare(X0, t, args)
+    out = np.empty((X0.shape[0], t.size, X0.shape[1]))
+    X = X0.copy()
+    out[:, 0] = X
+    for k in range(1, t.size):
+        n = int(np.ceil((t[k] - t[k-1])/max_step - 1e-9))
+        h = (t[k] - t[k-1])/n
+        tk = t[k-1]
+        for _ in range(n):
+            k1 = dXdt(X, tk, *args)
+            k2 = dXdt(X + 0.5*h*k1, tk + 0.5*h, *args)
+            k3 = dXdt(X + 0.5*h*k2, tk + 0.5*h, *args)
+            k4 = dXdt(X + h*k3, tk + h, *args)
+            X += (h/6)*(k1 + 2*k2 + 2*k3 + k4)
+            tk += h
+        out[:, k] = X
+    return out
+
+
+# Dormand-Prince 5(4) coefficients
+_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+_A = [[],
+      [1/5],
+      [3/40, 9/40],
+      [44/45, -56/15, 32/9],
+      [19372/6561, -25360/2187, 64448/6561, -212/729],
+      [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+      [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+_E = _B - np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200,
+                    187/2100, 1/40])
+
+
+def dopri5(dXdt, X0, t, args=(), rtol=1e-6, atol=1e-9, first_step=None,
+           max_step=np.inf):
+    """
+    Integrate a batch of ODEs with an adaptive Dormand-Prince 5(4) method.
+
+    All ``N`` systems share one step size, chosen so that the worst scaled
+    error in the batch stays below one. Steps are shortened to land exactly
+    on the output times, so no interpolation is needed.
+
+    Parameters are as for :func:`rk4`, with ``rtol`` and ``atol`` the
+    relative and absolute error tolerances.
+
+    Returns
+    -------
+    X : ndarray, shape ``(N, len(t), d)``
+    """
+    X0, t, args = _prepare(X0, t, args)
+    out = np.empty((X0.shape[0], t.size, X0.shape[1]))
+    X = X0.copy()
+    out[:, 0] = X
+    if t.size == 1:
+        return out
+    tk = t[0]
+    K = [None]*7
+    K[0] = dXdt(X, tk, *args)
+    if first_step is None:
+        scale = atol + rtol*np.abs(X)
+        d0 = np.sqrt(np.mean((X/scale)**2))
+        d1 = np.sqrt(np.mean((K[0]/scale)**2))
+        h = 0.01*d0/d1 if d0 > 1e-5 and d1 > 1e-5 else 1e-6
+    else:
+        h = first_step
+    h = min(h, max_step)
+    k = 1
+    while k < t.size:
+        h_try = min(h, t[k] - tk)
+        for s in range(1, 7):
+            dX = h_try*sum(a*Ki for a, Ki in zip(_A[s], K) if a != 0)
+            K[s] = dXdt(X + dX, tk + _C[s]*h_try, *args)
+        X_new = X + h_try*sum(b*Ki for b, Ki in zip(_B, K) if b != 0)
+        err = h_try*sum(e*Ki for e, Ki in zip(_E, K) if e != 0)
+        scale = atol + rtol*np.maximum(np.abs(X), np.abs(X_new))
+        err_norm = np.max(np.sqrt(np.mean((err/scale)**2, axis=1)))
+        if err_norm <= 1:
+            tk += h_try
+            X = X_new
+            K[0] = K[6]                  # first same as last
+            if tk >= t[k] - 1e-12*max(1, abs(t[k])):
+                tk = t[k]
+                out[:, k] = X
+                k += 1
+            factor = 5 if err_norm == 0 else min(5, 0.9*err_norm**-0.2)
+        else:
+            factor = max(0.2, 0.9*err_norm**-0.2)
+        h = min(h_try*factor, max_step)
+    return out
+
+
+def sir_sweep(beta, gamma, X0, t, method='rk4', **options):
+    """
+    Simulate the SIR model for many values of ``beta`` and ``gamma`` at once.
+
+    Parameters
+    ----------
+    beta, gamma : array_like
+        Transmission and recovery rates, scalars or arrays of length ``N``.
+    X0 : array_like
+        Initial ``[S, I, R]``, shape ``(3,)`` or ``(N, 3)``.
+    t : array_like
+        Output times.
+    method : {'rk4', 'dopri5'}
+        Fixed step Runge-Kutta or adaptive Dormand-Prince integration.
+    **options
+        Passed on to :func:`rk4` or :func:`dopri5`.
+
+    Returns
+    -------
+    X : ndarray, shape ``(N, len(t), 3)``
+    """
+    beta = np.atleast_1d(np.asarray(beta, dtype=float))
+    gamma = np.atleast_1d(np.asarray(gamma, dtype=float))
+    beta, gamma = np.broadcast_arrays(beta, gamma)
+    if method == 'rk4':
+        solver = rk4
+    elif method == 'dopri5':
+        solver = dopri5
+    else:
+        raise ValueError("method must be 'rk4' or 'dopri5', not %r" % method)
+    return solver(sir_dXdt, X0, t, args=(beta, gamma), **options)
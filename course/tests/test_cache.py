@@ -0,0 +1,132 @@
+"""
+Regression tests for the keys of :mod:`kujenga.cache`: anything that
+changes what a model computes must change its key. Run from the ``course``
+directory with ``python -m pytest tests``.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from kujenga import cache, metapopulation, phaseplane
+
+
+X0 = [0.99, 0.01, 0.0]
+t = np.linspace(0, 10, 11)
+
+
+def make_default(beta):
+    def dXdt(X, t, beta=beta, gamma=0.1):
+        S, I, R = X
+        return [-beta*S*I, beta*S*I - gamma*I, gamma*I]
+    # The same code and name, differing only in the default
+    dXdt.__qualname__ = 'dXdt'
+    return dXdt
+
+
+def test_default_arguments():
+    slow, fast = make_default(0.5), make_default(2.0)
+    assert cache.trajectory_key(slow, X0, t) != cache.trajectory_key(fast, X0, t)
+    store = cache.TrajectoryCache()
+    store.odeint(slow, X0, t)
+    I_fast = store.odeint(fast, X0, t)[-1, 1]
+    assert store.misses == 2
+    assert abs(I_fast - cache.integrate.odeint(fast, X0, t)[-1, 1]) < 1e-12
+
+
+params = [0.5, 0.1]
+param_dict = {'beta': 0.5, 'gamma': 0.1}
+
+
+def list_dXdt(X, t):
+    S, I, R = X
+    return [-params[0]*S*I, params[0]*S*I - params[1]*I, params[1]*I]
+
+
+def dict_dXdt(X, t):
+    S, I, R = X
+    beta, gamma = param_dict['beta'], param_dict['gamma']
+    return [-beta*S*I, beta*S*I - gamma*I, gamma*I]
+
+
+def test_global_list_and_dict():
+    before = cache.trajectory_key(list_dXdt, X0, t), cache.trajectory_key(dict_dXdt, X0, t)
+    params[0] = 2.0
+    param_dict['beta'] = 2.0
+    try:
+        after = cache.trajectory_key(list_dXdt, X0, t), cache.trajectory_key(dict_dXdt, X0, t)
+    finally:
+        params[0] = 0.5
+        param_dict['beta'] = 0.5
+    assert before[0] != after[0]
+    assert before[1] != after[1]
+
+
+beta = 0.5
+
+
+def infection(S, I):
+    return beta*S*I
+
+
+def helper_dXdt(X, t):
+    S, I, R = X
+    return [-infection(S, I), infection(S, I) - 0.1*I, 0.1*I]
+
+
+def test_global_read_through_helper():
+    global beta
+    before = cache.trajectory_key(helper_dXdt, X0, t)
+    beta = 2.0
+    try:
+        after = cache.trajectory_key(helper_dXdt, X0, t)
+    finally:
+        beta = 0.5
+    assert before != after
+
+
+def test_bound_method_state():
+    contact = sparse.identity(3, format='csr')
+    slow = metapopulation.Metapopulation(contact, beta=0.5, gamma=0.1)
+    fast = metapopulation.Metapopulation(contact, beta=2.0, gamma=0.1)
+    state = slow.initial_state(0.01)
+    assert (cache.trajectory_key(slow.dXdt, state, t) !=
+            cache.trajectory_key(fast.dXdt, state, t))
+    assert (cache.trajectory_key(slow.dXdt, state, t) ==
+            cache.trajectory_key(metapopulation.Metapopulation(contact, 0.5, 0.1).dXdt, state, t))
+
+
+class Opaque:
+    __slots__ = ('beta',)
+
+    def __init__(self, beta):
+        self.beta = beta
+
+
+opaque = Opaque(0.5)
+
+
+def opaque_dXdt(X, t):
+    S, I, R = X
+    return [-opaque.beta*S*I, opaque.beta*S*I - 0.1*I, 0.1*I]
+
+
+def test_unhashable_state_is_not_cached():
+    assert cache.trajectory_key(opaque_dXdt, X0, t) is None
+    store = cache.TrajectoryCache()
+    store.odeint(opaque_dXdt, X0, t)
+    opaque.beta = 2.0
+    try:
+        I = store.odeint(opaque_dXdt, X0, t)[-1, 1]
+        assert abs(I - cache.integrate.odeint(opaque_dXdt, X0, t)[-1, 1]) < 1e-12
+    finally:
+        opaque.beta = 0.5
+    assert store.hits == 0
+
+
+def test_field_cache_sees_defaults():
+    slow, fast = make_default(0.5), make_default(2.0)
+    complete = phaseplane.sir_complete
+    phaseplane.field_cache.clear()
+    a = phaseplane.vector_field(slow, (0, 1), (0, 1), n=5, complete=complete)
+    b = phaseplane.vector_field(fast, (0, 1), (0, 1), n=5, complete=complete)
+    assert not np.allclose(a.dX, b.dX)
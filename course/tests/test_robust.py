@@ -0,0 +1,50 @@
+"""
+Tests of :func:`kujenga.robust.theil_sen` against the median of every
+pairwise slope. Run from the ``course`` directory with ``python -m pytest
+tests``.
+"""
+
+import numpy as np
+import pytest
+
+from kujenga import robust
+
+
+def brute_force(x, y):
+    i, j = np.triu_indices(x.size, 1)
+    keep = x[i] != x[j]
+    m = np.median((y[i] - y[j])[keep]/(x[i] - x[j])[keep])
+    return m, np.median(y - m*x)
+
+
+def data(kind, n, seed=0):
+    rng = np.random.default_rng(seed)
+    if kind == 'continuous':
+        x = rng.normal(size=n)
+        return x, 0.5*x + rng.standard_t(2, size=n)
+    if kind == 'integers':
+        return rng.integers(0, 5, n).astype(float), rng.integers(0, 5, n).astype(float)
+    if kind == 'tied x':
+        x = rng.integers(0, 10, n).astype(float)
+        return x, 2*x + rng.normal(size=n)
+    if kind == 'line':
+        x = rng.integers(0, 50, n).astype(float)
+        return x, 3*x + 1
+    x = rng.normal(size=n)
+    return x, np.round(x + rng.normal(size=n))
+
+
+@pytest.mark.parametrize('kind', ['continuous', 'integers', 'tied x', 'line', 'rounded y'])
+@pytest.mark.parametrize('n', [50, 51, 340])
+def test_small_list_size(kind, n):
+    x, y = data(kind, n)
+    line = robust.theil_sen(x, y, seed=1, list_size=200)
+    m, k = brute_force(x, y)
+    assert line.m == pytest.approx(m, rel=1e-12, abs=1e-12)
+    assert line.k == pytest.approx(k, rel=1e-12, abs=1e-12)
+
+
+def test_many_tied_slopes():
+    x, y = data('integers', 3000)
+    line = robust.theil_sen(x, y, seed=0)
+    assert (line.m, line.k) == brute_force(x, y)